@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+# This is a part of td @ http://github.com/KenjiTakahashi/td
+# Karol "Kenji Takahashi" Woźniak © 2012 - 2014
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Measures td's startup time and the cost of its core operations.
+
+Usage: python benchmarks/benchmark.py [options], see --help.
+
+Results are written as a JSON report, so that runs made before and after
+a change can be compared.
+
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate import generate, save  # noqa
+from td.main import View, __version__  # noqa
+from td.model import Model, devtodo  # noqa
+from td.storage import ENGINES, NOSYNC  # noqa
+
+
+SORT = ([(1, True), (0, False)], {})
+DONE = ([(0, r'1$', True)], {})
+SEARCH = "release par doc"
+FILTER = ([(0, r'release parser', True)], {})
+
+
+def measure(func, repeat):
+    """Runs :func: :repeat: times.
+
+    :func: Function to measure.
+    :repeat: Number of runs.
+    :returns: Dictionary with the best, median and all timings in seconds.
+
+    """
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    ordered = sorted(times)
+    return {
+        'min': ordered[0],
+        'median': ordered[len(ordered) // 2],
+        'runs': times
+    }
+
+
+def command(directory, env, cold, *args):
+    """Prepares a function running td in a fresh interpreter.
+
+    :directory: Directory to run td in (its .td is used).
+    :env: Environment of the process.
+    :cold: Whether to start every run with an empty bytecode cache.
+    :args: Interpreter arguments.
+    :returns: Function running the command.
+
+    """
+    def _command():
+        if cold:
+            env['PYTHONPYCACHEPREFIX'] = tempfile.mkdtemp(dir=directory)
+        subprocess.check_call(
+            (sys.executable,) + args, cwd=directory, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    return _command
+
+
+def startup(directory, repeat):
+    """Measures startup of the td script and td.run().
+
+    Cold runs start with an empty bytecode cache (so that every module,
+    including the standard library, gets compiled), warm runs use the
+    interpreter's usual one.
+
+    :directory: Directory with a small list.
+    :repeat: Number of runs.
+    :returns: Dictionary of results.
+
+    """
+    env = dict(os.environ, HOME=directory, PYTHONPATH=ROOT)
+    env.pop('PYTHONPYCACHEPREFIX', None)
+    commands = {
+        'script': (os.path.join(ROOT, 'scripts', 'td'), 'v', '--no-color'),
+        'run': ('-c', "import sys, td; sys.argv[1:] = ['v', '--no-color'];"
+                " td.run()")
+    }
+    results = dict()
+    for name, args in commands.items():
+        cold = command(directory, dict(env), True, *args)
+        warm = command(directory, env, False, *args)
+        results[name] = {
+            'cold': measure(cold, repeat),
+            'warm': measure(warm, repeat)
+        }
+    return results
+
+
+def importtime(directory, top=10):
+    """Profiles imports done by 'import td.main' (using -X importtime).
+
+    td itself only imports td.client (to try the server first), so it is
+    td.main which a command run without the server has to wait for.
+
+    :directory: Directory to run the interpreter in.
+    :top: Number of slowest modules to report.
+    :returns: Dictionary with the total time and the :top: slowest modules
+    (in microseconds, including their own imports).
+
+    """
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import td.main'],
+        cwd=directory, env=dict(os.environ, PYTHONPATH=ROOT),
+        stderr=subprocess.PIPE, universal_newlines=True, check=True
+    )
+    modules = dict()
+    for line in process.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)', line)
+        if match:
+            modules[match.group(4)] = int(match.group(2))
+    slowest = sorted(modules.items(), key=lambda m: m[1], reverse=True)
+    return {
+        'total': modules.get('td.main', 0),
+        'modules': dict(slowest[:top])
+    }
+
+
+def model(directory):
+    """Creates a Model working on :directory:.
+
+    :directory: Directory with .td and .tdrc.
+    :returns: New Model.
+
+    """
+    m = Model()
+    m.setPath(os.path.join(directory, '.td'))
+    m.gpath = os.path.join(directory, '.tdrc')
+    m.durability = NOSYNC
+    return m
+
+
+def operations(directory, items, engine, repeat):
+    """Measures Model load/save, modify and View on :items:.
+
+    :directory: Directory to keep the list in.
+    :items: List to measure on.
+    :engine: Name of the storage engine.
+    :repeat: Number of runs of every operation.
+    :returns: Dictionary of results.
+
+    """
+    path = os.path.join(directory, '.td')
+    save(directory, items, engine=engine)
+
+    def load(cached):
+        def _load():
+            if not cached:
+                ENGINES[engine](path, NOSYNC).drop()
+            list(model(directory))
+        return _load
+
+    def add():
+        m = model(directory)
+        with m.session():
+            list(m)
+            m.add("benchmark")
+
+    loaded = model(directory)
+    list(loaded)
+    modified = loaded.modify(sort=SORT, done=DONE)
+    resident = model(directory)
+    resident.resident = True
+
+    def memoized():
+        with resident.session():
+            resident.modify(sort=SORT, done=DONE, purge=True)
+
+    def search():
+        with resident.session():
+            resident.search(SEARCH)
+
+    def view(colors):
+        def _view():
+            stdout, sys.stdout = sys.stdout, io.StringIO()
+            try:
+                View(modified, nocolor=not colors)
+            finally:
+                sys.stdout = stdout
+        return _view
+
+    results = {
+        'load': measure(load(False), repeat),
+        'load (cached)': measure(load(True), repeat),
+        'add and save': measure(add, repeat),
+        'modify': measure(lambda: loaded._modifyInternal(
+            sort=SORT, done=DONE, purge=True
+        ), repeat),
+        'modify (memoized)': measure(memoized, repeat),
+        'search': measure(search, repeat),
+        'load and search': measure(
+            lambda: model(directory).search(SEARCH), repeat
+        ),
+        'modify (limit 20)': measure(lambda: loaded._modifyInternal(
+            sort=SORT, limit=20, depth=1
+        ), repeat),
+        'modify (filter)': measure(lambda: loaded._modifyInternal(
+            sort=SORT, done=DONE, purge=True, filter=FILTER
+        ), repeat),
+        'view': measure(view(False), repeat),
+        'view (colors)': measure(view(True), repeat)
+    }
+    # Items are stored sorted from now on
+    model(directory).setOptions(sort=SORT)
+    add()
+    results['load (permanent sort)'] = measure(load(True), repeat)
+    results['add and save (permanent sort)'] = measure(add, repeat)
+    return results
+
+
+def importing(directory, items, repeat):
+    """Measures importing :items: from a devtodo .todo file.
+
+    :directory: Directory to keep the list in.
+    :items: List to measure on.
+    :repeat: Number of runs.
+    :returns: Dictionary of results.
+
+    """
+    save(directory, items, devtodo=True)
+    path = os.path.join(directory, '.td')
+
+    def _import():
+        os.remove(path)
+        devtodo(directory)
+
+    return measure(_import, repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '-s', '--sizes', default='1000,10000,100000,1000000',
+        help='comma separated list sizes (default: %(default)s)'
+    )
+    parser.add_argument(
+        '-d', '--depth', type=int, default=3,
+        help='maximum depth of generated lists (default: %(default)s)'
+    )
+    parser.add_argument(
+        '-f', '--fanout', type=int, default=5,
+        help='maximum children of an item (default: %(default)s)'
+    )
+    parser.add_argument(
+        '-e', '--engines', default='json',
+        help='comma separated storage engines (default: %(default)s)'
+    )
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=5,
+        help='runs of every measurement (default: %(default)s)'
+    )
+    parser.add_argument(
+        '-o', '--output', default='benchmark.json',
+        help='report file, - for stdout (default: %(default)s)'
+    )
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp(prefix='td-benchmark.')
+    try:
+        startupdir = os.path.join(directory, 'startup')
+        os.mkdir(startupdir)
+        model(startupdir).add("benchmark")
+        report = {
+            'td': __version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'parameters': vars(args),
+            'startup': startup(startupdir, args.repeat),
+            'imports': importtime(startupdir),
+            'operations': dict(),
+            'devtodo': dict()
+        }
+        for size in args.sizes.split(','):
+            items = generate(int(size), args.depth, args.fanout)
+            listdir = os.path.join(directory, 'devtodo-{}'.format(size))
+            os.mkdir(listdir)
+            report['devtodo'][size] = importing(listdir, items, args.repeat)
+            shutil.rmtree(listdir)
+            for engine in args.engines.split(','):
+                listdir = os.path.join(directory, '{}-{}'.format(engine, size))
+                os.mkdir(listdir)
+                print("{} items, {}...".format(size, engine), file=sys.stderr)
+                report['operations'].setdefault(size, dict())[engine] = \
+                    operations(listdir, items, engine, args.repeat)
+                shutil.rmtree(listdir)
+    finally:
+        shutil.rmtree(directory)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output == '-':
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
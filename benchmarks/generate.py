@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+# This is a part of td @ http://github.com/KenjiTakahashi/td
+# Karol "Kenji Takahashi" Woźniak © 2012 - 2014
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Generates synthetic ToDo lists for benchmarks and load testing.
+
+Usage: python benchmarks/generate.py [options] <directory>, see --help.
+
+Writes .td (using any of the storage engines) and, optionally, an
+equivalent devtodo .todo file.
+
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import xml.etree.ElementTree as etree
+from collections import deque
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from td.main import Arg  # noqa
+from td.model import Model  # noqa
+from td.storage import ENGINES, NOSYNC  # noqa
+
+
+WORDS = (
+    "fix", "write", "review", "release", "parser", "tests", "docs", "bug",
+    "index", "storage", "view", "refactor", "option", "remove", "add",
+    "check", "build", "deploy", "update", "cleanup", "benchmark", "later"
+)
+UNICODE = (
+    "zażółć", "gęślą", "jaźń", "ёлка", "привет", "日本語", "テスト",
+    "中文", "naïve", "café", "Ωμέγα", "✓", "★", "→", "😀"
+)
+DISTRIBUTIONS = ('fixed', 'uniform', 'geometric')
+
+
+def _children(rand, fanout, distribution):
+    """Draws a number of children of a single item.
+
+    :rand: Random number generator.
+    :fanout: Maximum number of children.
+    :distribution: One of DISTRIBUTIONS.
+    :returns: Number of children.
+
+    """
+    if distribution == 'uniform':
+        return rand.randint(0, fanout)
+    if distribution == 'geometric':
+        n = 0
+        while n < fanout and rand.random() < 0.5:
+            n += 1
+        return n
+    return fanout
+
+
+def generate(
+    count, depth=3, fanout=5, distribution='fixed',
+    priorities=(1, 1, 1, 1, 1), done=0.3, comments=0.2, length=40,
+    unicode=False, seed=0
+):
+    """Generates a list of :count: items in td's JSON format.
+
+    Levels are filled breadth first, items get their number of children
+    from :distribution: and the tree is at most :depth: levels deep.
+    Whatever does not fit goes to the top level.
+
+    :count: Number of items to generate.
+    :depth: Maximum number of levels.
+    :fanout: Maximum number of children of a single item.
+    :distribution: How the number of children is drawn, one of
+    DISTRIBUTIONS ('fixed' always gives :fanout:).
+    :priorities: Relative weights of priorities 1 to 5.
+    :done: Ratio of items marked as done.
+    :comments: Ratio of items with a comment.
+    :length: Maximum length of a comment (in words).
+    :unicode: Whether to mix non-ASCII words in.
+    :seed: Random seed, the same seed gives the same list.
+    :returns: List of items in form [name, priority, comment, done, children].
+
+    """
+    rand = random.Random(seed)
+    words = unicode and WORDS + UNICODE or WORDS
+    mean = {'fixed': fanout, 'uniform': fanout / 2, 'geometric': 1}
+    capacity = sum(mean[distribution] ** i for i in range(depth))
+    top = max(1, min(count, int(count / capacity)))
+
+    def text(n):
+        return " ".join(rand.choice(words) for _ in range(n))
+
+    def item():
+        return [
+            text(rand.randint(1, 5)),
+            rand.choices(range(1, 6), priorities)[0],
+            rand.random() < comments and text(rand.randint(1, length)) or "",
+            rand.random() < done,
+            []
+        ]
+
+    items = [item() for _ in range(top)]
+    left = count - top
+    queue = deque((i, 1) for i in items)
+    while left:
+        if not queue:
+            new = item()
+            items.append(new)
+            queue.append((new, 1))
+            left -= 1
+            continue
+        parent, level = queue.popleft()
+        if level >= depth:
+            continue
+        n = _children(rand, fanout, distribution)
+        for _ in range(min(n, left)):
+            child = item()
+            parent[4].append(child)
+            queue.append((child, level + 1))
+            left -= 1
+    return items
+
+
+def todo(items):
+    """Converts :items: into devtodo's XML format.
+
+    :items: List of items in td's JSON format.
+    :returns: XML document as bytes.
+
+    """
+    stamp = str(int(time.time()))
+
+    def _build(parent, subitems):
+        for name, priority, comment, done, children in subitems:
+            note = etree.SubElement(parent, 'note', {
+                'priority': Model.priorities[priority], 'time': stamp
+            })
+            if done:
+                note.set('done', stamp)
+            note.text = name
+            if comment:
+                etree.SubElement(note, 'comment').text = comment
+            _build(note, children)
+
+    root = etree.Element('todo', version='0.1.20')
+    _build(root, items)
+    return etree.tostring(root, encoding='utf-8')
+
+
+def save(directory, items, options=None, engine='json', devtodo=False):
+    """Writes :items: into :directory:.
+
+    :directory: Directory to write .td (and .todo) to.
+    :items: List of items in td's JSON format.
+    :options: Dictionary of permanent options to store.
+    :engine: Name of the storage engine.
+    :devtodo: Whether to write an equivalent .todo file.
+
+    """
+    path = os.path.join(directory, '.td')
+    for p in (path, path + '.journal', path + '.cache'):
+        if os.path.exists(p):
+            os.remove(p)
+    ENGINES[engine](path, NOSYNC).write(lambda: {
+        'items': items, 'refs': dict(), 'options': options or dict()
+    }, [])
+    if devtodo:
+        with open(os.path.join(directory, '.todo'), 'wb') as f:
+            f.write(todo(items))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', help='where to write the list')
+    parser.add_argument(
+        '-n', '--count', type=int, default=10000,
+        help='number of items (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--depth', type=int, default=3,
+        help='maximum depth (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--fanout', type=int, default=5,
+        help='maximum children of an item (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--distribution', choices=DISTRIBUTIONS, default='fixed',
+        help='how the number of children is drawn (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--priorities', default='1,1,1,1,1',
+        help='weights of priorities 1-5 (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--done-ratio', type=float, default=0.3,
+        help='ratio of done items (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--comments', type=float, default=0.2,
+        help='ratio of items with comments (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--comment-length', type=int, default=40,
+        help='maximum words in a comment (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--unicode', action='store_true', help='mix non-ASCII words in'
+    )
+    parser.add_argument(
+        '--seed', type=int, default=0, help='random seed (default: 0)'
+    )
+    parser.add_argument(
+        '--engine', choices=sorted(ENGINES), default='json',
+        help='storage engine (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--todo', action='store_true', help='also write a devtodo .todo'
+    )
+    parser.add_argument('-s', '--sort', help="stored sort pattern")
+    parser.add_argument('-p', '--purge', action='store_true',
+                        help="store the purge option")
+    parser.add_argument('-d', '--done', help="stored done pattern")
+    parser.add_argument('-D', '--undone', help="stored undone pattern")
+    args = parser.parse_args()
+
+    options = dict()
+    arg = Arg.__new__(Arg)  # Only pattern parsing is needed
+    if args.sort:
+        options['sort'] = arg._getPattern(args.sort)
+    if args.purge:
+        options['purge'] = True
+    if args.done or args.undone:
+        options['done'] = arg._getDone(args.done, args.undone)
+    items = generate(
+        args.count, args.depth, args.fanout, args.distribution,
+        [float(w) for w in args.priorities.split(',')], args.done_ratio,
+        args.comments, args.comment_length, args.unicode, args.seed
+    )
+    os.makedirs(args.directory, exist_ok=True)
+    save(args.directory, items, options, args.engine, args.todo)
+
+
+if __name__ == '__main__':
+    main()
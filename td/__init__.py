@@ -16,4 +16,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from td.main import run
+import sys
+
+
+def run():
+    """Runs td, on the td server if there is one running."""
+    from td.client import forward
+    if not forward(sys.argv):
+        from td.main import run
+        run()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# This is a part of td @ http://github.com/KenjiTakahashi/td
+# Karol "Kenji Takahashi" Woźniak © 2012 - 2014
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Thin td client, forwarding commands to a running td server.
+
+It is imported on every td call, so it should stay light on imports.
+
+"""
+
+import json
+import os
+import socket
+import sys
+
+
+def address():
+    """Gets path of the td server socket.
+
+    :returns: Value of $TD_SOCKET or ~/.td.sock.
+
+    """
+    return os.environ.get('TD_SOCKET') or os.path.expanduser('~/.td.sock')
+
+
+def forward(argv):
+    """Runs a td command on the td server, if there is one running.
+
+    :argv: Command line arguments (including program name).
+    :returns: True if the server handled the command, False if it should
+    be run locally.
+
+    """
+    path = address()
+    if argv[1:2] == ["--server"] or not os.path.exists(path):
+        return False
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+    except (AttributeError, OSError):  # No AF_UNIX or no server
+        return False
+    with sock:
+        sock.sendall(json.dumps({
+            'argv': argv,
+            'cwd': os.getcwd(),
+            'home': os.path.expanduser('~')
+        }).encode('utf-8') + b'\n')
+        sock.shutdown(socket.SHUT_WR)
+        data = b''.join(iter(lambda: sock.recv(1 << 16), b''))
+    if not data:  # Server failed, let the local run report it
+        return False
+    response = json.loads(data.decode('utf-8'))
+    if response['status'] != 'ok':
+        return False
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    return True
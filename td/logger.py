@@ -17,14 +17,38 @@
 
 
 import logging
+from contextlib import contextmanager
+from functools import wraps
 
 
 def logs(func):
     logger = logging.getLogger('td')
 
+    @wraps(func)
     def _logs(self, *args, **kwargs):
         try:
             return func(self, *args, **kwargs)
         except Exception as e:
             logger.error(e)
     return _logs
+
+
+@contextmanager
+def collects(errors):
+    """Collects messages of errors logged inside of the block.
+
+    Messages are still logged as usual.
+
+    :errors: A list to append the messages to.
+
+    """
+    logger = logging.getLogger('td')
+
+    def _collect(record):
+        errors.append(str(record.msg))
+        return True
+    logger.addFilter(_collect)
+    try:
+        yield errors
+    finally:
+        logger.removeFilter(_collect)
@@ -17,10 +17,15 @@
 
 
 from collections import deque
-import readline
+import json
+import logging
+import os
+import re
+import shlex
 import sys
 from td.model import Model
-from td.logger import logs
+from td.storage import EXCLUSIVE, NOSYNC, FSYNC, DIRSYNC
+from td.logger import logs, collects
 
 
 __version__ = '0.4'
@@ -51,6 +56,38 @@ class NotEnoughArgumentsError(EException):
         self.message = "{}: Not enough arguments.".format(name)
 
 
+class NotInteractiveError(BaseException):
+    """Raised when user input is needed, but cannot be asked for.
+
+    Derives from BaseException, so that it is not swallowed by @logs.
+
+    """
+
+
+class InvalidLineError(EException):
+    def __init__(self, number, msg):
+        self.message = "batch: Line {}: {}.".format(number, msg)
+
+
+class BatchFailedError(EException):
+    def __init__(self, count):
+        self.message = (
+            "batch: {} command(s) failed, no changes were saved.".format(count)
+        )
+
+
+class InvalidNumberError(EException):
+    def __init__(self, name, arg):
+        self.message = "{}: Invalid number [{}].".format(name, arg)
+
+
+class UnreadableListError(EException):
+    def __init__(self, path, msg):
+        self.message = "recursive: Cannot read list at [{}]: {}".format(
+            path, msg
+        )
+
+
 class View(object):
     """Class used to display items on the screen."""
 
@@ -61,41 +98,145 @@ class View(object):
     DIM = '\033[2m'
     BRIGHT = '\033[1m'
     RESET = '\033[0m'
+    CHUNK = 4096
 
     def __init__(self, model, **opts):
         """Creates new View instance.
 
         Displays the Model contents, basing on :opts:, and exits.
 
+        Output is written in chunks of View.CHUNK lines,
+        instead of line by line.
+
+        If "indexes" option is given, :model: is shown as a flat list
+        of items found at these (dotted) indexes, without children.
+
         :model: Model instance.
         :opts: Options defining how the View looks.
 
         """
         colors = not opts.get("nocolor")
+        self.ids = opts.get("ids")
+        write = sys.stdout.write
+        chunk = list()
+        indexes = opts.get("indexes")
+        if indexes is not None:
+            lines = self._found(model, indexes, colors)
+        else:
+            lines = self._lines(model, 0, colors, opts.get("start", 1))
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) == View.CHUNK:
+                write("".join(chunk))
+                chunk = list()
+        if chunk:
+            write("".join(chunk))
+
+    def _lines(self, submodel, offset, colors, start=1):
+        """Renders :submodel: (and its children) into lines of text.
+
+        :submodel: List of items to render.
+        :offset: Indentation of the :submodel: level.
+        :colors: Whether to add color codes.
+        :start: Number of the first item.
+        :returns: Generator of lines (including newline characters).
+
+        """
+        numoffset = len(str(start + len(submodel) - 1)) - 1
+        indent = " " * offset
+        narrow = indent + " " * numoffset
+        reset = colors and View.RESET or ""
+        for i, v in enumerate(submodel, start=start):
+            padding = i < 10 and narrow or indent
+            yield "{}{}{}{}{}{}{}{}\n".format(
+                reset,
+                padding,
+                colors and View.COLORS[v.priority] or "",
+                colors and (v.done and View.DIM or View.BRIGHT) or "",
+                i, v.done and '-' or '.', v.name,
+                self.ids and " @{}".format(v.id) or ""
+            )
+            if v.comment:
+                yield "{}{}{}({})\n".format(
+                    padding, " " * (len(str(i)) + 1), reset, v.comment
+                )
+            yield from self._lines(v.children, offset + 2 + numoffset, colors)
+
+    def _found(self, items, indexes, colors):
+        """Renders :items: (without children) as found at :indexes:.
+
+        :items: List of items to render.
+        :indexes: List of dotted indexes of :items:.
+        :colors: Whether to add color codes.
+        :returns: Generator of lines (including newline characters).
+
+        """
+        reset = colors and View.RESET or ""
+        for i, v in zip(indexes, items):
+            yield "{}{}{}{}{}{}{}\n".format(
+                reset,
+                colors and View.COLORS[v.priority] or "",
+                colors and (v.done and View.DIM or View.BRIGHT) or "",
+                i, v.done and '-' or '.', v.name,
+                self.ids and " @{}".format(v.id) or ""
+            )
+            if v.comment:
+                yield "{}{}({})\n".format(
+                    " " * (len(i) + 1), reset, v.comment
+                )
+
+
+class Counts(object):
+    """Class used to display numbers of items of many lists."""
+
+    def __init__(self, counts, **opts):
+        """Creates new Counts instance.
+
+        Displays a table of numbers of not done/done items of every
+        priority (and all of them) for every list, followed by totals,
+        and exits.
+
+        :counts: List of (name, {priority: [not done, done]}) tuples.
+        :opts: Options defining how the table looks.
+
+        """
+        colors = not opts.get("nocolor")
+        priorities = range(1, len(Model.priorities))
+        totals = dict()
+        rows = [["list"] + Model.priorities[1:] + ["total"]]
+        for name, c in counts:
+            for priority, (undone, done) in c.items():
+                total = totals.setdefault(priority, [0, 0])
+                total[0] += undone
+                total[1] += done
+            rows.append([name] + self._cells(c, priorities))
+        rows.append(["total"] + self._cells(totals, priorities))
+        widths = [max(len(v) for v in column) for column in zip(*rows)]
+        for j, row in enumerate(rows):
+            line = "  ".join([row[0].ljust(widths[0])] + [
+                v.rjust(w) for v, w in zip(row[1:], widths[1:])
+            ])
+            if colors and j in [0, len(rows) - 1]:
+                line = View.BRIGHT + line + View.RESET
+            sys.stdout.write(line + "\n")
+
+    def _cells(self, counts, priorities):
+        """Formats :counts: of a single list.
+
+        :counts: Dictionary of priority: [not done, done].
+        :priorities: Priorities to show, in order.
+        :returns: List of "not done/done" strings, one for every priority
+        and the total.
 
-        def _show(submodel, offset):
-            numoffset = len(str(len(list(submodel)))) - 1
-            for i, v in enumerate(submodel, start=1):
-                (name, priority, comment, done, subitems) = v
-                padding = " " * offset
-                if i < 10:
-                    padding += " " * numoffset
-                print("{}{}{}{}{}{}{}".format(
-                    colors and View.RESET or "",
-                    padding,
-                    colors and View.COLORS[priority] or "",
-                    colors and (done and View.DIM or View.BRIGHT) or "",
-                    i, done and '-' or '.', name
-                ))
-                padding += " " * (len(str(i)) + 1)
-                if comment:
-                    print("{}{}({})".format(
-                        padding,
-                        colors and View.RESET or "",
-                        comment
-                    ))
-                _show(subitems, offset + 2 + numoffset)
-        _show(model, 0)
+        """
+        cells = list()
+        for priority in priorities:
+            cells.append("{}/{}".format(*counts.get(priority, [0, 0])))
+        cells.append("{}/{}".format(
+            sum(u for u, _ in counts.values()),
+            sum(d for _, d in counts.values())
+        ))
+        return cells
 
 
 class Parser(object):
@@ -164,23 +305,71 @@ class Parser(object):
                     """a (add)\t\tAdds new item. See [td a -h].\n"""
                     """e (edit)\tEdits existing item. See [td e -h].\n"""
                     """r (rm)\t\tRemoves existing item. See [td r -h].\n"""
+                    """M (move)\tMoves items to another parent."""
+                    """ See [td M -h].\n"""
+                    """s (search)\tFinds items by words in their names"""
+                    """ and comments. See [td s -h].\n"""
                     """d (done)\tMarks items as done. See [td d -h].\n"""
                     """D (undone)\tMarks items as not done. See [td D -h].\n"""
+                    """b (batch)\tRuns many commands at once."""
+                    """ See [td b -h].\n"""
+                    """x (export)\tWrites items as JSON Lines."""
+                    """ See [td x -h].\n"""
+                    """i (import)\tReads items from JSON Lines."""
+                    """ See [td i -h].\n"""
                     """\nAdditional options:\n"""
                     """  -h (--help)\tShows this screen.\n"""
-                    """  -v (--version)Shows version number."""
+                    """  -v (--version)Shows version number.\n"""
+                    """  --recursive\tShows lists of all projects under"""
+                    """ a directory. See [td --recursive -h].\n"""
+                    """  --server\tKeeps running and serves next td"""
+                    """ calls (must be the only argument)."""
                 )
             elif arg == "-v" or arg == "--version":
                 print("td :: {}".format(__version__))
+            elif arg == "--recursive":
+                args = dict()
+                if self.argv and not self.argv[0].startswith("-"):
+                    args["root"] = self.argv.popleft()
+                self._part("recursive", self.arg.recursive, {
+                    "--view": ("view", False),
+                    "--no-color": ("nocolor", False),
+                    "-j": ("jobs", True), "--jobs": ("jobs", True)
+                },
+                    """Usage: td --recursive [-h (--help)] [directory]"""
+                    """ [command(s)], where [command(s)] are any of:\n\n"""
+                    """--view\t\t\tShows all the items instead of"""
+                    """ counting them.\n"""
+                    """--no-color\t\tDo not add color codes to the output.\n"""
+                    """-j (--jobs) <number>\tReads lists with <number>"""
+                    """ processes (default: one per CPU).\n"""
+                    """\nFinds td (and devtodo) lists in [directory] (the"""
+                    """ current one by default) and all directories under"""
+                    """ it, except hidden ones, and shows numbers of"""
+                    """ not done/done items of every priority in each of"""
+                    """ them. Numbers are cached in ~/.tdprojects, so only"""
+                    """ lists which changed are read again.\n"""
+                    """\nAdditional options:\n"""
+                    """  -h (--help)\t\tShows this screen.""",
+                    **args
+                )
             elif arg == "v" or arg == "view":
+                args = dict()
+                if self.argv and self.arg.model.exists(self.argv[0]):
+                    args["index"] = self.argv.popleft()
                 self._part("view", self.arg.view, {
                     "--no-color": ("nocolor", False),
+                    "--ids": ("ids", False),
+                    "--limit": ("limit", True),
+                    "--offset": ("offset", True),
+                    "--depth": ("depth", True),
                     "-s": ("sort", True), "--sort": ("sort", True),
                     "-p": ("purge", False), "--purge": ("purge", False),
                     "-d": ("done", True), "--done": ("done", True),
-                    "-D": ("undone", True), "--undone": ("undone", True)
+                    "-D": ("undone", True), "--undone": ("undone", True),
+                    "-f": ("filter", True), "--filter": ("filter", True)
                 },
-                    """Usage: td v [-h (--help)] [command(s)]"""
+                    """Usage: td v [-h (--help)] [index] [command(s)]"""
                     """, where [command(s)] are any of:\n\n"""
                     """-s (--sort) <pattern>\tSorts the output using"""
                     """ <pattern>.\n"""
@@ -189,9 +378,20 @@ class Parser(object):
                     """ <pattern> as done.\n"""
                     """-D (--undone) <pattern>\tDisplays items matching"""
                     """ <pattern> as not done.\n"""
+                    """-f (--filter) <pattern>\tShows only items matching"""
+                    """ <pattern> (same as for -d), with their parents.\n"""
                     """--no-color\t\tDo not add color codes to the output.\n"""
+                    """--ids\t\t\tShows items' ids (usable as @id"""
+                    """ instead of index).\n"""
+                    """--limit <number>\tShows at most <number> items"""
+                    """ (not counting their children).\n"""
+                    """--offset <number>\tSkips first <number> items.\n"""
+                    """--depth <number>\tShows at most <number> levels.\n"""
+                    """\nIf [index] is specified, only children of that"""
+                    """ item are shown.\n"""
                     """\nAdditional options:\n"""
-                    """  -h (--help)\t\tShows this screen."""
+                    """  -h (--help)\t\tShows this screen.""",
+                    **args
                 )
             elif arg == "m" or arg == "modify":
                 self._part("modify", self.arg.modify, {
@@ -277,6 +477,52 @@ class Parser(object):
                     """  -h (--help)\tShows this screen.""",
                     **args
                 )
+            elif arg == "M" or arg == "move":
+                args = dict(indexes=list())
+                while self.argv and not self.argv[0].startswith("-"):
+                    args["indexes"].append(self.argv.popleft())
+                if not args["indexes"] and (
+                    not self.argv or self.argv[0] not in ["-h", "--help"]
+                ):
+                    raise NotEnoughArgumentsError("move")
+                self._part("move", self.arg.move, {
+                    "--parent": ("parent", True)
+                },
+                    """Usage: td M [-h (--help)] <index(es)> --parent"""
+                    """ <index>\n\n"""
+                    """Moves items to the end of <index>'s children"""
+                    """ (top level if it is empty), in the given"""
+                    """ order.\nAll indexes refer to the list as it was"""
+                    """ before the move. An item cannot be moved into"""
+                    """ itself or its own children.\n"""
+                    """\nAdditional options:\n"""
+                    """  -h (--help)\tShows this screen.""",
+                    **args
+                )
+            elif arg == "s" or arg == "search":
+                args = dict(query=list())
+                while self.argv and not self.argv[0].startswith("-"):
+                    args["query"].append(self.argv.popleft())
+                if not args["query"] and (
+                    not self.argv or self.argv[0] not in ["-h", "--help"]
+                ):
+                    raise NotEnoughArgumentsError("search")
+                self._part("search", self.arg.search, {
+                    "--no-color": ("nocolor", False),
+                    "--ids": ("ids", False)
+                },
+                    """Usage: td s [-h (--help)] <word(s)> [command(s)]"""
+                    """, where [command(s)] are any of:\n\n"""
+                    """--no-color\tDo not add color codes to the output.\n"""
+                    """--ids\t\tShows items' ids (usable as @id"""
+                    """ instead of index).\n"""
+                    """\nShows items having all <word(s)> in their names"""
+                    """ or comments, ignoring case. Words also match"""
+                    """ longer words starting with them.\n"""
+                    """\nAdditional options:\n"""
+                    """  -h (--help)\tShows this screen.""",
+                    **args
+                )
             elif arg == "d" or arg == "done":
                 args = dict()
                 if not self.argv:
@@ -313,7 +559,8 @@ class Parser(object):
                     "-s": ("sort", True), "--sort": ("sort", True),
                     "-p": ("purge", False), "--purge": ("purge", False),
                     "-d": ("done", True), "--done": ("done", True),
-                    "-D": ("undone", True), "--undone": ("undone", True)
+                    "-D": ("undone", True), "--undone": ("undone", True),
+                    "--storage": ("storage", True)
                 },
                     """Usage: td o [-h (--help)] [command(s)]"""
                     """, where [command(s)] are any of:\n\n"""
@@ -327,9 +574,64 @@ class Parser(object):
                     """ <pattern> as done.\n"""
                     """-D (--undone) <pattern>\tAlways marks items maching"""
                     """ <pattern> as not done.\n"""
+                    """--storage <engine>\tStores this ToDo list using"""
+                    """ <engine> (json|journal|sqlite).\n"""
                     """\nAdditional options:\n"""
                     """  -h (--help)\t\tShows this screen."""
                 )
+            elif arg == "b" or arg == "batch":
+                args = dict()
+                if self.argv and not self.argv[0].startswith("-"):
+                    args["path"] = self.argv.popleft()
+                self._part("batch", self.arg.batch, {
+                    "-a": ("atomic", False), "--atomic": ("atomic", False)
+                },
+                    """Usage: td b [-h (--help)] [file] [command(s)]"""
+                    """, where [command(s)] are any of:\n\n"""
+                    """-a (--atomic)\tSaves nothing if any command"""
+                    """ fails.\n"""
+                    """\nRuns commands read from [file] (or standard"""
+                    """ input), one per line, loading and saving"""
+                    """ the list only once.\n"""
+                    """Every line holds td arguments, either as in shell"""
+                    """ (e.g. d 1.2) or as a JSON array"""
+                    """ (e.g. ["d", "1.2"]).\n"""
+                    """Empty lines and lines starting with # are skipped.\n"""
+                    """\nAdditional options:\n"""
+                    """  -h (--help)\tShows this screen.""",
+                    **args
+                )
+            elif arg == "x" or arg == "export":
+                args = dict()
+                if self.argv and not self.argv[0].startswith("-"):
+                    args["path"] = self.argv.popleft()
+                self._part("export", self.arg.exportItems, {
+                },
+                    """Usage: td x [-h (--help)] [file]\n\n"""
+                    """Writes all items to [file] (or standard output),"""
+                    """ one JSON object per line.\n"""
+                    """\nAdditional options:\n"""
+                    """  -h (--help)\tShows this screen.""",
+                    **args
+                )
+            elif arg == "i" or arg == "import":
+                args = dict()
+                if self.argv and not self.argv[0].startswith("-"):
+                    args["path"] = self.argv.popleft()
+                self._part("import", self.arg.importItems, {
+                    "-r": ("replace", False), "--replace": ("replace", False)
+                },
+                    """Usage: td i [-h (--help)] [file] [command(s)]"""
+                    """, where [command(s)] are any of:\n\n"""
+                    """-r (--replace)\tReplaces all items instead of"""
+                    """ appending.\n"""
+                    """\nReads items written by [td x] from [file]"""
+                    """ (or standard input). Nothing is changed if"""
+                    """ any of them is invalid.\n"""
+                    """\nAdditional options:\n"""
+                    """  -h (--help)\tShows this screen.""",
+                    **args
+                )
             else:
                 raise UnrecognizedCommandError("td", arg)
 
@@ -351,13 +653,19 @@ class Get(object):
         "highest": "5"
     }
     _LEN = 27
+    # Set to False when there is no terminal to ask (e.g. in td server)
+    interactive = True
 
     def __init__(self):
         """Creates new Get instance.
 
-        Also sets readline hook.
+        Also sets readline hook. readline is imported here, so that
+        non-interactive commands do not have to pay for it.
 
         """
+        if not Get.interactive:
+            raise NotInteractiveError()
+        import readline
         self.value = None
         readline.set_startup_hook(lambda: readline.insert_text(
             self.value is not None and str(self.value) or ""
@@ -426,6 +734,9 @@ class Arg(object):
 
     """
 
+    # Use defaults instead of asking for missing values (set by batch)
+    defaults = False
+
     def __init__(self, model):
         """Creates new Arg instance.
 
@@ -462,14 +773,21 @@ class Arg(object):
             except ValueError:
                 raise InvalidPatternError(k, "Invalid level number")
 
+        def _getRegexp(r):
+            try:
+                re.compile(r)
+            except re.error:
+                raise InvalidPatternError(r, 'Invalid regular expression')
+            return r
+
         def _getDone(p):
             v = p.split('=')
             if len(v) == 2:
                 try:
-                    return (Model.indexes[v[0]], v[1], done)
+                    return (Model.indexes[v[0]], _getRegexp(v[1]), done)
                 except KeyError:
                     raise InvalidPatternError(v[0], 'Invalid field name')
-            return (None, v[0], done)
+            return (None, _getRegexp(v[0]), done)
         ipattern1 = list()
         ipattern2 = dict()
         for s in ipattern.split(','):
@@ -521,21 +839,54 @@ class Arg(object):
         if undone:
             return self._getPattern(undone, False)
 
-    def view(self, sort=None, purge=False, done=None, undone=None, **kwargs):
+    def _getNumber(self, name, value, default=None):
+        """Parses a positive number.
+
+        :name: Name of the argument.
+        :value: A value to parse.
+        :default: Value to use if :value: is None.
+        :returns: Parsed number.
+
+        """
+        if value is None:
+            return default
+        try:
+            number = int(value)
+        except ValueError:
+            raise InvalidNumberError(name, value)
+        if number < 0 or number == 0 and name in ["depth", "jobs"]:
+            raise InvalidNumberError(name, value)
+        return number
+
+    def view(
+        self, sort=None, purge=False, done=None, undone=None, filter=None,
+        index=None, offset=None, limit=None, depth=None, **kwargs
+    ):
         """Handles the 'v' command.
 
         :sort: Sort pattern.
         :purge: Whether to purge items marked as 'done'.
         :done: Done pattern.
         :undone: Not done pattern.
+        :filter: Pattern of items to show.
+        :index: Index of the item, which children to show.
+        :offset: Number of items to skip.
+        :limit: Maximum number of items to show.
+        :depth: Maximum number of levels to show.
         :kwargs: Additional arguments to pass to the View object.
 
         """
+        offset = self._getNumber("offset", offset, 0)
         View(self.model.modify(
             sort=self._getPattern(sort),
             purge=purge,
-            done=self._getDone(done, undone)
-        ), **kwargs)
+            done=self._getDone(done, undone),
+            filter=self._getPattern(filter, True),
+            index=index,
+            offset=offset,
+            limit=self._getNumber("limit", limit),
+            depth=self._getNumber("depth", depth)
+        ), start=offset + 1, **kwargs)
 
     def modify(self, sort=None, purge=False, done=None, undone=None):
         """Handles the 'm' command.
@@ -586,6 +937,32 @@ class Arg(object):
         if self.model.exists(index):
             self.model.remove(index)
 
+    def move(self, indexes, parent=None):
+        """Handles the 'M' command.
+
+        :indexes: Indexes of the items to move.
+        :parent: Index of the new parent ("" for top level).
+
+        """
+        if parent is None:
+            raise NotEnoughArgumentsError("move")
+        if parent is True:  # An empty --parent ""
+            parent = ""
+        self.model.move(indexes, parent)
+
+    def search(self, query, **kwargs):
+        """Handles the 's' command.
+
+        :query: List of words to look for.
+        :kwargs: Additional arguments to pass to the View object.
+
+        """
+        found = self.model.search(" ".join(query))
+        View(
+            [item for _, item in found],
+            indexes=[index for index, _ in found], **kwargs
+        )
+
     def done(self, index):
         """Handles the 'd' command.
 
@@ -604,6 +981,121 @@ class Arg(object):
         if self.model.exists(index):
             self.model.edit(index, done=False)
 
+    def batch(self, path=None, atomic=False):
+        """Handles the 'b' command.
+
+        Nothing is asked for, fields missing from commands get their
+        current (or default) values. Adding an item without name fails.
+
+        :path: Path of the file with commands, None for standard input.
+        :atomic: Whether to drop all changes if any command fails.
+
+        """
+        if path is None and not Get.interactive:
+            raise NotInteractiveError()  # Standard input is not ours
+        lines = path is None and sys.stdin or open(path)
+        self.defaults = True
+        errors = list()
+        try:
+            with collects(errors):
+                for number, line in enumerate(lines, start=1):
+                    self._line(number, line)
+        finally:
+            self.defaults = False
+            if path is not None:
+                lines.close()
+        if errors and atomic:
+            self.model.discard()
+            raise BatchFailedError(len(errors))
+
+    @logs
+    def _line(self, number, line):
+        """Runs a single command of the 'b' command.
+
+        :number: Number of the line.
+        :line: The line, in shell or JSON format.
+
+        """
+        line = line.strip()
+        if not line or line.startswith("#"):
+            return
+        try:
+            if line.startswith("["):
+                argv = json.loads(line)
+                if not all(isinstance(a, str) for a in argv):
+                    raise ValueError("Expected a list of strings")
+            else:
+                argv = shlex.split(line)
+        except ValueError as e:
+            raise InvalidLineError(number, e)
+        if argv[:1] in (["b"], ["batch"]):
+            raise InvalidLineError(number, "Nested batch is not supported")
+        try:
+            Parser(self, ["td"] + argv).rock()
+        except NotInteractiveError:
+            raise InvalidLineError(number, "Needs user input")
+
+    def recursive(self, root=".", view=False, jobs=None, **kwargs):
+        """Handles the '--recursive' option.
+
+        Lists which cannot be read are reported and skipped.
+
+        :root: Directory to look for lists in.
+        :view: Whether to show all the items instead of counting them.
+        :jobs: Number of processes to read the lists with.
+        :kwargs: Additional arguments to pass to the View object.
+
+        """
+        from td.projects import collect, summarize  # Only needed here
+        jobs = self._getNumber("jobs", jobs)
+        gpath = self.model._paths()[1]
+        logger = logging.getLogger('td')
+        if view:
+            results = collect(root, gpath, jobs)
+        else:
+            results = summarize(root, gpath, jobs, os.path.join(
+                os.path.dirname(gpath), '.tdprojects'
+            ))
+        found = list()
+        for directory, result, e in results:
+            if result is None:
+                logger.error(UnreadableListError(directory, e))
+            else:
+                found.append((os.path.relpath(directory, root), result))
+        if not view:
+            Counts(found, **kwargs)
+            return
+        for name, items in found:
+            sys.stdout.write("{}:\n".format(name))
+            View(items, **kwargs)
+
+    def exportItems(self, path=None):
+        """Handles the 'x' command.
+
+        :path: Path of the file to write to, None for standard output.
+
+        """
+        if path is None:
+            self.model.exportItems(sys.stdout)
+            return
+        with open(path, "w") as f:
+            self.model.exportItems(f)
+
+    def importItems(self, path=None, replace=False):
+        """Handles the 'i' command.
+
+        :path: Path of the file to read from, None for standard input.
+        :replace: Whether to replace all items instead of appending.
+
+        """
+        if path is None:
+            if not Get.interactive:
+                raise NotInteractiveError()  # Standard input is not ours
+            self.model.importItems(sys.stdin, replace)
+            return
+        with open(path) as f:
+            self.model.importItems(f, replace)
+
     def options(self, glob=False, **args):
         """Handles the 'o' command.
 
@@ -615,7 +1107,9 @@ class Arg(object):
         for argname, argarg in args.items():
             if argname == "sort":
                 argarg = self._getPattern(argarg)
-            if argname not in ["done", "undone"]:
+            if argname == "storage":
+                self.model.setStorage(argarg)
+            elif argname not in ["done", "undone"]:
                 kwargs[argname] = argarg
         if "done" in args or "undone" in args:
             kwargs["done"] = self._getDone(
@@ -624,23 +1118,40 @@ class Arg(object):
 
         self.model.setOptions(glob=glob, **kwargs)
 
-    def getKwargs(self, args, values={}, get=Get()):
+    def getKwargs(self, args, values={}, get=None):
         """Gets necessary data from user input.
 
         :args: Dictionary of arguments supplied in command line.
         :values: Default values dictionary, supplied for editing.
         :get: Object used to get values from user input.
+        Created only when some field actually needs prompting.
         :returns: A dictionary containing data gathered from user input.
 
         """
         kwargs = dict()
         for field in ['name', 'priority', 'comment', 'parent']:
-            fvalue = args.get(field) or get.get(field, values.get(field))
+            fvalue = args.get(field)
+            if not fvalue and self.defaults:
+                fvalue = values.get(field)
+                if fvalue is None and field == 'name':
+                    raise NotInteractiveError()
+            elif not fvalue:
+                get = get or Get()
+                fvalue = get.get(field, values.get(field))
             if fvalue is not None:
                 kwargs[field] = fvalue
         return kwargs
 
 
 def run():
+    if os.environ.get('TD_LOCKING') == EXCLUSIVE:
+        Model.locking = EXCLUSIVE
+    if os.environ.get('TD_DURABILITY') in [NOSYNC, FSYNC, DIRSYNC]:
+        Model.durability = os.environ['TD_DURABILITY']
+    if sys.argv[1:] == ["--server"]:
+        from td.server import serve
+        serve()
+        return
     model = Model()
-    Arg(model)
+    with model.session():
+        Arg(model)
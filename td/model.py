@@ -17,11 +17,19 @@
 
 
 import os
-import shutil
+import heapq
 import json
 import re
 from collections import UserList
-from td.logger import logs
+from contextlib import contextmanager
+from functools import wraps
+from operator import attrgetter, itemgetter
+from td.logger import logs, collects
+from td.search import Index
+from td.storage import (
+    write, lock, signature, getStorage, ENGINES, NOSYNC, OPTIMISTIC,
+    EXCLUSIVE, UnknownStorageError
+)
 
 
 class NoItemError(Exception):
@@ -32,7 +40,42 @@ class NoItemError(Exception):
         return self.message
 
 
-def devtodo(path):
+class InvalidMoveError(Exception):
+    def __init__(self, k, parent):
+        self.message = (
+            "Cannot move [{}] into itself or its child [{}].".format(k, parent)
+        )
+
+    def __str__(self):
+        return self.message
+
+
+class ConflictError(Exception):
+    def __init__(self, k):
+        self.message = (
+            "List was changed by another td, nothing was saved: {}".format(k)
+        )
+
+    def __str__(self):
+        return self.message
+
+
+class InvalidImportError(Exception):
+    def __init__(self, k):
+        self.message = "Invalid item at line [{}].".format(k)
+
+    def __str__(self):
+        return self.message
+
+
+def devtodo(path, save=True):
+    """Reads devtodo list (.todo) in :path:, if there is one.
+
+    :path: Directory of the list.
+    :save: Whether to also write it as td list (.td).
+    :returns: Items in JSON form, None if there is no devtodo list.
+
+    """
     try:
         inp = open(os.path.join(path, '.todo')).read()
     except IOError:
@@ -44,89 +87,379 @@ def devtodo(path):
         def _build(subtree):
             _data = list()
             for elem in subtree:
+                if elem.tag != 'note':
+                    continue
                 attr = elem.attrib
-                comment = ""
-                children = list()
-                try:
-                    child = elem[0]
-                except IndexError:
-                    pass
-                else:
-                    if child.tag == 'comment':
-                        comment = child.text.strip()
-                    else:
-                        children = _build(elem)
+                comment = elem.find('comment')
                 _data.append([
                     elem.text.strip(),
                     Model.priorities.index(attr['priority']),
-                    comment, bool(attr.get('done')), children
+                    comment is not None and (comment.text or "").strip() or "",
+                    bool(attr.get('done')), _build(elem)
                 ])
             return _data
         data = _build(tree)
-        open(os.path.join(path, '.td'), 'w').write(
-            json.dumps({'items': data, 'refs': dict(), 'options': dict()})
-        )
+        if save:
+            write(os.path.join(path, '.td'), json.dumps(
+                {'items': data, 'refs': dict(), 'options': dict()}
+            ))
         return data
 
 
-def load(func):
-    """@decorator: Loads data before executing :func:."""
-    def aux(self, *args, **kwargs):
-        path = (hasattr(self, 'path') and self.path
-                or os.path.join(os.getcwd(), '.td'))
-        gpath = (hasattr(self, 'gpath') and self.gpath
-                 or os.path.expanduser('~/.tdrc'))
-        try:
-            data = json.loads(open(path).read())
-        except IOError:
-            data = devtodo(os.path.dirname(path))
-            if data is not None:
-                self[:] = data
-            self.refs = dict()
-            self.options = dict()
+class _Descending(object):
+    """Wraps a value to compare in reverse order."""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def compileSort(sort):
+    """Compiles sort pattern into key functions.
+
+    Rules of a pattern are meant to be applied one after another, so the
+    last one is the most significant and the first one is the least.
+    They get merged into a single composite key, so that each level can
+    be sorted just once.
+
+    :sort: Sort pattern, as accepted by Model.modify.
+    :returns: A tuple of ((key, reverse), {<level>: (key, reverse)}), where
+    key is None if there is nothing to sort by. Levels without any rules
+    are left out.
+
+    """
+    if sort is None:
+        return (None, False), {}
+    sortAll, sortLevels = sort
+
+    def _compile(rules):
+        rules = [(Item.FIELDS[index], r) for index, r in rules[::-1]]
+        if not rules:
+            return None, False
+        if len(set(r for _, r in rules)) == 1:
+            return attrgetter(*[field for field, _ in rules]), rules[0][1]
+
+        def key(item):
+            return tuple(
+                r and _Descending(getattr(item, field))
+                or getattr(item, field) for field, r in rules
+            )
+        return key, False
+    return _compile(sortAll), dict(
+        (int(level), _compile(rules))
+        for level, rules in sortLevels.items() if rules
+    )
+
+
+def compileDone(done):
+    """Compiles done|undone pattern for repeated use.
+
+    Regular expressions get compiled once and level numbers (which are
+    strings when read back from JSON) are turned into integers.
+
+    :done: Done pattern, as accepted by Model.modify.
+    :returns: A pattern of the same shape, with <regexp> values replaced
+    by compiled match functions (or None).
+
+    """
+    if done is None:
+        return [], {}
+    doneAll, doneLevels = done
+
+    def _compile(rules):
+        return [
+            (index, regexp is not None and re.compile(regexp).match or None,
+             du) for index, regexp, du in rules
+        ]
+    return _compile(doneAll), dict(
+        (int(level), _compile(rules)) for level, rules in doneLevels.items()
+    )
+
+
+def compileMark(done):
+    """Compiles done|undone pattern into a marking function.
+
+    :done: Done pattern, as accepted by Model.modify.
+    :returns: A function of (item, level), returning item's done mark
+    according to :done:.
+
+    """
+    doneAll, doneLevels = compileDone(done)
+
+    def _mark_(v, index, match, du):
+        if du is None:
+            return v.done
+        if index is None:
+            for v_ in (v.name, v.priority, v.comment):
+                if match is None or match(
+                    isinstance(v_, str) and v_ or str(v_)
+                ):
+                    return du
+            return v.done
+        if match is None or match(str(v[index])):
+            return du
+
+    def _mark(v, i):
+        if done is None:
+            return v.done
+        result = None
+        rules = doneLevels.get(i)
+        if rules is not None:
+            for rule in rules:
+                result = _mark_(v, *rule)
+            if result is not None:
+                return result
+        for rule in doneAll:
+            result = _mark_(v, *rule)
+        if result is None:
+            return v.done
+        return result
+    return _mark
+
+
+def compileFilter(filter):
+    """Compiles filter pattern into a matching function.
+
+    :filter: Filter pattern, shaped like done pattern of Model.modify
+    (done|undone marks are ignored).
+    :returns: A function of (item, level), returning True if item matches
+    any of the rules for all levels or for its own level.
+
+    """
+    filterAll, filterLevels = compileDone(filter)
+
+    def _match_(v, index, match, _):
+        if index is None:
+            values = (v.name, v.priority, v.comment)
         else:
-            self[:] = data['items']
-            self.refs = data['refs']
-            self.options = data['options']
+            values = (v[index],)
+        for v_ in values:
+            if match is None or match(isinstance(v_, str) and v_ or str(v_)):
+                return True
+        return False
+
+    def _match(v, i):
+        for rule in filterLevels.get(i, ()):
+            if _match_(v, *rule):
+                return True
+        for rule in filterAll:
+            if _match_(v, *rule):
+                return True
+        return False
+    return _match
+
+
+def _bisect(items, item, key, reverse, position=None):
+    """Finds where a stable sort would put :item: among sorted :items:.
+
+    :items: Items sorted by :key:, without :item:.
+    :item: Item to find the position for.
+    :key: Sort key function (None for no sorting).
+    :reverse: Whether :items: are sorted in descending order.
+    :position: Position :item: had before (among items equal to it),
+    None to put it after all of them, like a new one.
+    :returns: Position to insert :item: at.
+
+    """
+    if key is None:
+        if position is None:
+            return len(items)
+        return position
+    k = key(item)
+
+    def before(a, b):
+        if reverse:
+            return b < a
+        return a < b
+    lo, hi = 0, len(items)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if before(k, key(items[mid])):
+            hi = mid
+        else:
+            lo = mid + 1
+    if position is None:
+        return lo
+    right, lo = lo, 0
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if before(key(items[mid]), k):
+            lo = mid + 1
+        else:
+            hi = mid
+    return min(max(position, lo), right)
+
+
+class Item(object):
+    """A single td item.
+
+    Behaves like a [name, priority, comment, done, children] list
+    (which is also how it is stored on disk), but keeps its fields
+    in slots, instead of a full list.
+
+    Items also have a stable id, which is not a part of the list
+    (it is stored in Model.refs, see Model._number).
+
+    """
+
+    FIELDS = ('name', 'priority', 'comment', 'done', 'children')
+    __slots__ = FIELDS + ('id',)
+
+    def __init__(self, name, priority, comment, done, children, id=None):
+        self.name = name
+        self.priority = priority
+        self.comment = comment
+        self.done = done
+        self.children = children
+        self.id = id
+
+    @classmethod
+    def fromJSON(cls, items):
+        """Creates items from their on-disk representation.
+
+        Items get no ids.
+
+        :items: A list of [name, priority, comment, done, children] lists.
+        :returns: A list of Item instances.
+
+        """
+        return [
+            cls(name, priority, comment, done, cls.fromJSON(children))
+            for name, priority, comment, done, children in items
+        ]
+
+    @classmethod
+    def toJSON(cls, items):
+        """Creates on-disk representation of :items:.
+
+        :items: A list of Item instances.
+        :returns: A list of [name, priority, comment, done, children] lists.
+
+        """
+        return [[
+            item.name, item.priority, item.comment,
+            item.done, cls.toJSON(item.children)
+        ] for item in items]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        return getattr(self, Item.FIELDS[index])
+
+    def __setitem__(self, index, value):
+        setattr(self, Item.FIELDS[index], value)
+
+    def __iter__(self):
+        yield self.name
+        yield self.priority
+        yield self.comment
+        yield self.done
+        yield self.children
+
+    def __len__(self):
+        return 5
+
+    def __eq__(self, other):
         try:
-            self.globalOptions = json.loads(open(gpath).read())
-        except IOError:
-            self.globalOptions = dict()
-        self.data = self._modifyInternal(
-            sort=self.options.get('sort') or self.globalOptions.get('sort'),
-            purge=self.options.get('purge') or self.globalOptions.get('purge'),
-            done=self.options.get('done') or self.globalOptions.get('done')
-        )
+            return len(other) == 5 and all(
+                a == b for a, b in zip(self, other)
+            )
+        except TypeError:
+            return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def load(func):
+    """@decorator: Loads data before executing :func:.
+
+    Inside of a Model.session, data is loaded only on the first call.
+
+    """
+    @wraps(func)
+    def aux(self, *args, **kwargs):
+        if not (self._replaying or self._session and self._loaded):
+            self._load()
         return func(self, *args, **kwargs)
     return aux
 
 
+# Parameters of Model calls which refer to items
+REFERENCES = ('index', 'indexes', 'parent')
+
+
 def save(func):
     """@decorator: Saves data after executing :func:.
 
-    Also performs modifications set as permanent options.
+    Only parts marked as changed by :func: get written.
+    Inside of a Model.session, saving is deferred until the session ends.
+
+    Calls changing local data are also recorded as operations,
+    for storage engines which write changes only and for merging
+    changes of others (see Model._merge). Items are referred to by id
+    there, wherever possible, as positions may change in the meantime.
 
     """
+    code = func
+    while hasattr(code, '__wrapped__'):
+        code = code.__wrapped__
+    code = code.__code__
+    parameters = code.co_varnames[1:code.co_argcount]
+
+    @wraps(func)
     def aux(self, *args, **kwargs):
-        out = func(self, *args, **kwargs)
-        path = (hasattr(self, 'path') and self.path
-                or os.path.join(os.getcwd(), '.td'))
-        gpath = (hasattr(self, 'gpath') and self.gpath
-                 or os.path.expanduser('~/.tdrc'))
-        if os.path.exists(path):
-            shutil.copy2(path, os.path.join(os.path.dirname(path), '.td~'))
-        open(path, 'w').write(
-            json.dumps({
-                'items': self.data,
-                'refs': self.refs,
-                'options': self.options
-            })
-        )
-        open(gpath, 'w').write(json.dumps(self.globalOptions))
+        if self._replaying:
+            return func(self, *args, **kwargs)
+        if not self._session:
+            with self.session():  # Saves at the end
+                return aux(self, *args, **kwargs)
+        if not self._loaded:
+            self._load()  # Indexes are looked up before the call
+        recorded = _references(parameters, args, kwargs, self._reference)
+        dirty, self._dirty = self._dirty, set()
+        try:
+            out = func(self, *args, **kwargs)
+        finally:
+            changed, self._dirty = self._dirty, dirty | self._dirty
+        if 'items' in changed:
+            self._views.clear()
+        if changed - {'globalOptions'}:
+            self._operations.append([func.__name__] + recorded)
         return out
+    aux.parameters = parameters
     return aux
 
 
+def _references(parameters, args, kwargs, convert):
+    """Applies :convert: to the arguments of a call which refer to items.
+
+    :parameters: Names of the positional parameters of the call.
+    :args: Positional arguments of the call.
+    :kwargs: Keyword arguments of the call.
+    :convert: Function taking and returning an index.
+    :returns: A list of [args, kwargs], with the indexes converted.
+
+    """
+    def _convert(name, value):
+        if name not in REFERENCES:
+            return value
+        if isinstance(value, list):
+            return [convert(v) for v in value]
+        return convert(value)
+    return [
+        [_convert(name, v) for name, v in zip(parameters, args)],
+        dict((k, _convert(k, v)) for k, v in kwargs.items())
+    ]
+
+
 class Model(UserList):
     """A holder for all the td data.
 
@@ -142,6 +475,658 @@ class Model(UserList):
         "state": 3
     }
     priorities = [None, "lowest", "low", "medium", "high", "highest"]
+    # NOSYNC: leave flushing to the OS, FSYNC: sync written files,
+    # DIRSYNC: also sync their directories (see TD_DURABILITY)
+    durability = NOSYNC
+    # Keep data between sessions, as long as the files do not change
+    resident = False
+    # OPTIMISTIC: lock only for writing, redoing own changes on top of
+    # the ones written by others since reading; EXCLUSIVE: also hold
+    # the lock for whole sessions
+    locking = OPTIMISTIC
+
+    def __init__(self, *args, **kwargs):
+        self._views = dict()  # Used by data setter, called by UserList
+        super().__init__(*args, **kwargs)
+        self._session = False
+        self._loaded = False
+        self._replaying = False
+        self._dirty = set()
+        self._operations = []
+        self._index = None
+        self._locked = False
+        self._derivedAs = None
+        self._compiled = None
+        self._search = None
+        self._searchAs = None
+        self._fresh = None
+
+    @property
+    def data(self):
+        """The actual items, modified according to permanent options.
+
+        Items are read and modifications are applied lazily, on first
+        access after loading. Modifications are skipped if there are
+        no permanent options set, or if items were stored already
+        modified according to the same options (see _document).
+
+        """
+        if self._raw is not None:
+            items, self._raw = self._raw, None
+            if callable(items):
+                items = items()
+            self._data = Item.fromJSON(items)
+            self._number(self._data)
+            self._fresh = self.refs['next']
+            self._views.clear()
+            if self.storage.queries and self._operations:
+                self._replay(self._operations)
+        if not self._derived:
+            self._derived = True
+            if any(self._permanent.values()):
+                key = self._permanentKey()
+                if self.refs.get('derived') != key:
+                    self._data = self._modifyInternal(**self._permanent)
+                    self._index = None
+                    self._views.clear()
+                # Engines writing changes only need to write them all
+                if self.refs.get('derived') != key or self.storage.queries:
+                    self._operations.append(
+                        ['modifyInPlace', [], dict(self._permanent)]
+                    )
+                self._derivedAs = key
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._raw = None
+        self._derived = True
+        self._index = None
+        self._views.clear()
+        self._derivedAs = None
+
+    def _permanentKey(self):
+        """Gets a key identifying permanent options.
+
+        :returns: Permanent options encoded as a string.
+
+        """
+        return json.dumps([
+            self._permanent['sort'], self._permanent['purge'],
+            self._permanent['done']
+        ], sort_keys=True)
+
+    def _rules(self):
+        """Gets compiled permanent options.
+
+        :returns: A tuple of (sortAll, sortLevels, mark, purge, levels),
+        see compileSort and compileMark; levels tells whether any of
+        the rules is level specific.
+
+        """
+        key = self._permanentKey()
+        if self._compiled is None or self._compiled[0] != key:
+            sortAll, sortLevels = compileSort(self._permanent['sort'])
+            levels = bool(sortLevels or compileDone(
+                self._permanent['done']
+            )[1])
+            self._compiled = key, (
+                sortAll, sortLevels, compileMark(self._permanent['done']),
+                self._permanent['purge'], levels
+            )
+        return self._compiled[1]
+
+    def _place(self, item, siblings, level, position=None):
+        """Inserts :item: into :siblings: like deriving the data would.
+
+        While the data is kept modified according to permanent options,
+        :item: gets marked, purged or put at its sorted position, so
+        that changing a single item does not require modifying the whole
+        database again. Otherwise it is just inserted.
+
+        :item: Item to insert.
+        :siblings: List of items, not containing :item:.
+        :level: Level of :siblings: (1 for top level).
+        :position: Position :item: had in :siblings: before, None for
+        a new item (which goes after items equal to it).
+        :returns: False if :item: got purged, True otherwise.
+
+        """
+        if self._derivedAs is None:
+            if position is None:
+                position = len(siblings)
+            siblings.insert(position, item)
+            return True
+        sortAll, sortLevels, mark, purge, _ = self._rules()
+        item.done = mark(item, level)
+        if purge and item.done:
+            self._index = None
+            return False
+        key, reverse = sortLevels.get(level) or sortAll
+        siblings.insert(
+            _bisect(siblings, item, key, reverse, position), item
+        )
+        return True
+
+    def _number(self, items):
+        """Gives ids to freshly read :items:.
+
+        Ids are kept in refs, as a list in depth-first order, along with
+        the next free id. If they do not match the items (e.g. the file
+        was written by older td), new ids are given to all of them.
+
+        :items: List of Item instances (with their children).
+
+        """
+        nodes = list(self._walk(items))
+        ids = self.refs.get('ids')
+        if ids is None or len(ids) != len(nodes):
+            first = self.refs.get('next', 1)
+            ids = range(first, first + len(nodes))
+        for (item, _), id in zip(nodes, ids):
+            item.id = id
+        self.refs['next'] = max(
+            self.refs.get('next', 1), len(nodes) and max(ids) + 1 or 1
+        )
+        self._index = None
+
+    def _newIds(self, items):
+        """Gives next free ids to :items: (and their children)."""
+        for item, _ in self._walk(items):
+            item.id = self.refs.get('next', 1)
+            self.refs['next'] = item.id + 1
+
+    def _walk(self, items, parent=None):
+        """Iterates over :items: and their children, depth-first.
+
+        :items: List of items to walk.
+        :parent: Item holding :items: (None for top level).
+        :returns: Generator of (item, parent item) tuples.
+
+        """
+        stack = [(iter(items), parent)]
+        while stack:
+            item = next(stack[-1][0], None)
+            if item is None:
+                stack.pop()
+                continue
+            yield item, stack[-1][1]
+            stack.append((iter(item.children), item))
+
+    def _ids(self):
+        """Gets the id index.
+
+        It is built on first use after a structural change.
+
+        :returns: A dictionary of id: (item, parent item or None).
+
+        """
+        if self._index is None:
+            self._index = dict(
+                (item.id, (item, parent))
+                for item, parent in self._walk(self.data)
+            )
+        return self._index
+
+    def _locate(self, index):
+        """Finds an item.
+
+        First part of :index: may be an @id, the rest are positions
+        (1-based) within the children of the previous part.
+
+        :index: Index split into parts (must not be empty).
+        :returns: A tuple of (list holding the item, position, item).
+        :raises: IndexError, KeyError or ValueError if there is no such item.
+
+        """
+        if not index:
+            raise IndexError(index)
+        siblings, item = self.data, None
+        for j, c in enumerate(index):
+            if j == 0 and c.startswith('@'):
+                item, parent = self._ids()[int(c[1:])]
+                siblings = self.data if parent is None else parent.children
+                position = next(
+                    i for i, v in enumerate(siblings) if v is item
+                )
+                continue
+            if item is not None:
+                siblings = item.children
+            position = int(c) - 1
+            item = siblings[position]
+        return siblings, position, item
+
+    def _item(self, index):
+        """Finds an item, like _locate does.
+
+        :index: Index split into parts.
+        :returns: The item.
+        :raises: NoItemError if there is no such item.
+
+        """
+        try:
+            if index:
+                return self._locate(index)[2]
+        except (IndexError, KeyError, ValueError):
+            pass
+        raise NoItemError('.'.join(index))
+
+    def _reference(self, index):
+        """Gets a reference to the item at :index:, not using positions.
+
+        Items added since the data was read or saved are not referred
+        to by id, as they may get different ids when merging (see
+        _merge).
+
+        :index: Index (any other argument is returned as it is).
+        :returns: "@<id>" of the item, or :index: if there is no such item.
+
+        """
+        if not isinstance(index, str):
+            return index
+        index = self._split(index)
+        try:
+            if self._detached():
+                id = self.storage.find(index)
+            else:
+                id = self._locate(index)[2].id
+        except (IndexError, KeyError, ValueError):
+            id = None
+        if not id or self._fresh is not None and id >= self._fresh:
+            return '.'.join(index)
+        return '@{}'.format(id)
+
+    def _stable(self, index, fresh):
+        """Checks whether :index: still refers to the same item.
+
+        :index: Index, as given to a Model call.
+        :fresh: First id given since the data was read (None if unknown).
+        :returns: False if :index: refers to an item by position, or by
+        id of an item added since the data was read.
+
+        """
+        if not isinstance(index, str):
+            return True
+        index = self._split(index)
+        if not index:
+            return True
+        if len(index) > 1 or not index[0].startswith('@'):
+            return False
+        try:
+            return fresh is None or int(index[0][1:]) < fresh
+        except ValueError:
+            return False
+
+    def _within(self, item, parent):
+        """Checks whether :parent: is :item: or one of its descendants.
+
+        Goes up from :parent: through the id index, so it costs as much
+        as the depth of :parent:.
+
+        :item: Item to look for.
+        :parent: Item to start at (None for top level).
+        :returns: True if :item: is among :parent: and its ancestors.
+
+        """
+        ids = self._ids()
+        while parent is not None:
+            if parent is item:
+                return True
+            parent = ids[parent.id][1]
+        return False
+
+    def _move(self, item, parent, siblings=None, position=None):
+        """Moves :item: to the end of :parent:'s children.
+
+        The item is detached by its identity (or :position: in
+        :siblings:, if known), never by comparing items, and the id index
+        is updated in place. It is then inserted as a new one would be
+        (see _place).
+
+        :item: Item to move.
+        :parent: New parent item (None for top level).
+        :siblings: List currently holding :item:.
+        :position: Position of :item: in :siblings:.
+
+        """
+        ids = self._ids()
+        old = ids[item.id][1]
+        if siblings is None:
+            siblings = self.data if old is None else old.children
+            position = next(i for i, v in enumerate(siblings) if v is item)
+        level = self._depth(parent)
+        children = self.data if parent is None else parent.children
+        del siblings[position]
+        if not self._place(item, children, level):
+            return
+        ids[item.id] = (item, parent)
+        if (self._derivedAs is not None and self._rules()[4]
+                and level != self._depth(old)):
+            # Children get to a different level, with different rules
+            item.children = self._modifyInternal(
+                index='@{}'.format(item.id), **self._permanent
+            )
+            self._index = None
+
+    def _children(self, index):
+        """Gets children of the item at :index: (top level if empty).
+
+        :index: Index split into parts.
+        :returns: List of items.
+
+        """
+        if not index:
+            return self.data
+        return self._locate(index)[2].children
+
+    def _level(self, index):
+        """Gets the level (1 for top level) of children of :index:.
+
+        :index: Index split into parts.
+        :returns: Level number.
+
+        """
+        if index and index[0].startswith('@'):
+            item = self._ids()[int(index[0][1:])][0]
+            return len(index) + self._depth(item) - 1
+        return len(index) + 1
+
+    def _depth(self, item):
+        """Gets the level (1 for top level) of children of :item:.
+
+        :item: Item (None for top level).
+        :returns: Level number.
+
+        """
+        ids, level = self._ids(), 1
+        while item is not None:
+            level += 1
+            item = ids[item.id][1]
+        return level
+
+    def _searchIndex(self, build=True):
+        """Gets the search index (see search.Index) of all the items.
+
+        It is read from the file next to the database on first use, if
+        it was stored for the very files the data was read from, and
+        kept up to date by every change after that. Otherwise it is built
+        from scratch, but only when searching.
+
+        :build: Whether to build the index if it cannot be read.
+        :returns: Index instance, or None if there is none.
+
+        """
+        if self._search is None:
+            self._search = False
+            if self._searchAs is not None:
+                self._search = Index.read(
+                    self._paths()[0] + '.index', self._searchAs
+                ) or False
+        if self._search is False and build:
+            self._search = Index.build(
+                item for item, _ in self._walk(self.data)
+            )
+        return self._search or None
+
+    def _paths(self):
+        """Gets local and global storage paths.
+
+        :returns: A tuple of (local path, global path).
+
+        """
+        path = (hasattr(self, 'path') and self.path
+                or os.path.join(os.getcwd(), '.td'))
+        gpath = (hasattr(self, 'gpath') and self.gpath
+                 or os.path.expanduser('~/.tdrc'))
+        return path, gpath
+
+    def _load(self):
+        """Reads data from permanent storage.
+
+        Also performs modifications set as permanent options.
+
+        """
+        path, gpath = self._paths()
+        stamp = self._stat()
+        self._searchAs = None
+        self.storage = getStorage(path, self.durability)
+        data, operations = self.storage.read()
+        if data is None:
+            self._raw = devtodo(os.path.dirname(path)) or []
+            self.refs = dict()
+            self.options = dict()
+        else:
+            self._raw = data['items']
+            self.refs = data['refs']
+            self.options = data['options']
+        self._derived = True
+        self._derivedAs = None
+        self._fresh = None
+        self._views.clear()
+        self._replay(operations)
+        self._dirty = set()
+        self._operations = []
+        self._search = None
+        if stamp[0] is not None and self._stat()[:2] == stamp[:2]:
+            # Nobody wrote the files while reading them
+            self._searchAs = stamp[:2]
+        try:
+            self.globalOptions = json.loads(open(gpath).read())
+        except IOError:
+            self.globalOptions = dict()
+        self._permanent = {
+            'sort': self.options.get('sort')
+            or self.globalOptions.get('sort'),
+            'purge': self.options.get('purge')
+            or self.globalOptions.get('purge'),
+            'done': self.options.get('done')
+            or self.globalOptions.get('done')
+        }
+        self._derived = False
+        if operations:
+            self.refs.pop('derived', None)  # Not applied in stored order
+        self._loaded = True
+        self._stamp = self.resident and stamp
+
+    def _stat(self):
+        """Gets a signature of the files data is loaded from.
+
+        :returns: See storage.signature.
+
+        """
+        path, gpath = self._paths()
+        return signature([path, path + '.journal', gpath])
+
+    def _replay(self, operations):
+        """Applies recorded :operations: to in-memory data.
+
+        :operations: A list of [name, args, kwargs] Model calls.
+
+        """
+        self._replaying = True
+        try:
+            for name, args, kwargs in operations:
+                getattr(self, name)(*args, **kwargs)
+        finally:
+            self._replaying = False
+
+    def _detached(self):
+        """Checks whether calls can go straight to the storage engine.
+
+        That is when the engine supports queries, items were not read yet
+        and there are neither permanent options (which change indexes),
+        nor pending changes, which are not visible to the engine yet.
+
+        :returns: True if the storage engine should be queried directly.
+
+        """
+        return (self._raw is not None and self.storage.queries
+                and not self._operations
+                and not any(self._permanent.values()))
+
+    @contextmanager
+    def _lock(self):
+        """Holds the database lock for the time of the block.
+
+        Nested calls do nothing, the outermost one holds the lock.
+
+        """
+        if self._locked:
+            yield
+            return
+        self._locked = True
+        try:
+            with lock(self._paths()[0]):
+                yield
+        finally:
+            self._locked = False
+
+    def _merge(self):
+        """Reads data again and redoes recorded operations on top of it.
+
+        Used when someone else wrote the database since it was read.
+        Operations are the same calls, with items referred to by id, so
+        the result is as if they were made after the other changes.
+
+        :raises: ConflictError if any of them cannot be made anymore,
+            or refers to an item which cannot be told by id.
+
+        """
+        operations, dirty = self._operations, self._dirty
+        unstable = list()
+
+        def _check(index):
+            if not self._stable(index, self._fresh):
+                unstable.append(index)
+            return index
+        for name, args, kwargs in operations:
+            _references(getattr(Model, name).parameters, args, kwargs, _check)
+        if unstable:
+            self.discard()
+            raise ConflictError(
+                "Cannot tell which item [{}] is anymore, as it is not"
+                " referred to by id.".format(unstable[0])
+            )
+        globalOptions = self.globalOptions
+        session, self._session = self._session, True
+        errors = list()
+        try:
+            self._load()
+            with collects(errors):
+                for name, args, kwargs in operations:
+                    getattr(self, name)(*args, **kwargs)
+        except Exception as e:
+            errors.append(str(e))
+        finally:
+            self._session = session
+        if errors:
+            self.discard()
+            raise ConflictError(errors[0])
+        if 'globalOptions' in dirty:
+            self.globalOptions = globalOptions
+        self._dirty |= dirty
+
+    def _save(self):
+        """Writes changed data to permanent storage.
+
+        Local file is written only if items, refs or local options changed
+        and global file only if global options changed.
+
+        Local file is locked while writing. If it was written by someone
+        else in the meantime, own changes are merged first (see _merge).
+        Search index, if kept up to date, is stored for the new file.
+
+        """
+        path, gpath = self._paths()
+        if self._dirty & {'items', 'refs', 'options'}:
+            with self._lock():
+                if self.storage.changed():
+                    self._merge()
+                self.storage.write(self._document, self._operations)
+                self._searchAs = self._stat()[:2]
+                if self._search:
+                    self._search.write(path + '.index', self._searchAs)
+        if 'globalOptions' in self._dirty:
+            write(gpath, json.dumps(self.globalOptions), self.durability)
+        self._dirty = set()
+        self._operations = []
+        if self._raw is None:
+            self._fresh = self.refs['next']  # Saved items keep their ids
+        if self.resident:
+            self._stamp = self._stat()
+
+    def _document(self):
+        """Gets the whole local database document.
+
+        If items are modified according to current permanent options,
+        refs say so (as 'derived'), so that it is not done again on load.
+
+        :returns: A dictionary with items, refs and local options.
+
+        """
+        data = self.data
+        refs = dict(self.refs, ids=[item.id for item, _ in self._walk(data)])
+        refs.pop('derived', None)
+        if (self._derivedAs is not None
+                and self._derivedAs == self._permanentKey()):
+            refs['derived'] = self._derivedAs
+        return {
+            'items': Item.toJSON(data),
+            'refs': refs,
+            'options': self.options
+        }
+
+    @contextmanager
+    def session(self):
+        """Groups multiple Model calls into a single load/save cycle.
+
+        Data is read from permanent storage on first access only, every
+        subsequent call is served from memory and changes are written back
+        at most once, when the session ends without an exception.
+        Nested sessions are merged into the outermost one.
+
+        A resident Model keeps its data for the next session, unless
+        the files change in the meantime or options were changed.
+
+        With EXCLUSIVE locking, the database is locked for the whole
+        session.
+
+        """
+        if self._session:
+            yield self
+            return
+        if self.locking == EXCLUSIVE and not self._locked:
+            with self._lock(), self.session():
+                yield self
+            return
+        self._session = True
+        self._loaded = (self.resident and self._loaded
+                        and self._stamp == self._stat())
+        self._dirty = set()
+        self._operations = []
+        keep = False
+        try:
+            yield self
+            keep = not self._dirty & {'options', 'globalOptions'}
+            if self._dirty:
+                self._save()
+        finally:
+            self._session = False
+            self._loaded = self.resident and keep and self._loaded
+            self._dirty = set()
+            self._operations = []
+
+    def discard(self):
+        """Drops changes made in the current session.
+
+        Nothing gets written and data is read from permanent storage again
+        on next access.
+
+        """
+        self._dirty = set()
+        self._operations = []
+        self._loaded = False
 
     def setPath(self, path):
         """Sets permanent storage path.
@@ -151,6 +1136,30 @@ class Model(UserList):
         """
         self.path = path
 
+    @load
+    def setStorage(self, engine):
+        """Moves the database to a different storage engine.
+
+        :engine: Name of the engine, one of storage.ENGINES.
+
+        """
+        try:
+            storage = ENGINES[engine](self.storage.path, self.durability)
+        except KeyError:
+            raise UnknownStorageError(engine)
+        if type(storage) is type(self.storage):
+            return
+        with self._lock():
+            if self.storage.changed():
+                self._merge()
+            storage.version = self.storage.version
+            storage.write(self._document, [])
+        self.storage.drop()
+        self.storage = storage
+        # Pending changes are written already
+        self._operations = []
+        self._dirty -= {'items', 'refs'}
+
     @save
     @load
     def add(self, name, priority=3, comment="", parent=""):
@@ -167,11 +1176,24 @@ class Model(UserList):
         :parent: Item's parent ("" for top-level item).
 
         """
-        item = [name, priority, comment, False, []]
-        data = self.data
-        for c in self._split(parent):
-            data = data[int(c) - 1][4]
-        data.append(item)
+        if self._detached():
+            if not self.storage.exists(self._split(parent)):
+                raise NoItemError(parent)
+            self._dirty.add('items')
+            return
+        parent = self._split(parent)
+        data = self._children(parent)
+        item = Item(name, priority, comment, False, [])
+        self._newIds([item])
+        search = self._searchIndex(False)
+        if search is not None:
+            search.add(item)
+        placed = self._place(item, data, self._level(parent))
+        if placed and self._index is not None:
+            self._index[item.id] = (
+                item, parent and self._locate(parent)[2] or None
+            )
+        self._dirty.add('items')
 
     @save
     @load
@@ -183,7 +1205,9 @@ class Model(UserList):
 
         Every argument, which is not None, will get changed.
 
-        If parent is not None, the item will get reparented.
+        If parent is not None, the item will get reparented (to the end
+        of parent's children, unless it already is one of them), but not
+        into itself or its own children.
         Use parent=-1 or parent='' for reparenting to top-level.
 
         :index: Index of the item to edit.
@@ -198,29 +1222,92 @@ class Model(UserList):
             parent = ''
         parent = self._split(parent)
         index = self._split(index)
-        item = self.data
-        for j, c in enumerate(index):
-            item = item[int(c) - 1]
-            if j + 1 != len(index):
-                item = item[4]
+        if self._detached():
+            for i in [index, parent]:
+                if i is not None and not self.storage.exists(i):
+                    raise NoItemError('.'.join(i))
+            if parent is not None and self.storage.within(index, parent):
+                raise InvalidMoveError('.'.join(index), '.'.join(parent))
+            self._dirty.add('items')
+            return
+        try:
+            siblings, position, item = self._locate(index)
+        except (IndexError, KeyError, ValueError):
+            raise NoItemError('.'.join(index))
+        if parent is not None:
+            target = None
+            if parent:
+                target = self._item(parent)
+            if self._within(item, target):
+                raise InvalidMoveError('.'.join(index), '.'.join(parent))
+        move = parent is not None and self._ids()[item.id][1] is not target
+        if not move and all(v is None or v == getattr(item, k) for k, v in [
+            ('name', name), ('priority', priority),
+            ('comment', comment), ('done', done)
+        ]):
+            return  # Nothing changes, so nothing gets written
+        search = None
+        if name is not None or comment is not None:
+            search = self._searchIndex(False)
+        if search is not None:
+            search.discard(item)
         if name is not None:
-            item[0] = name
+            item.name = name
         if priority is not None:
-            item[1] = priority
+            item.priority = priority
         if comment is not None:
-            item[2] = comment
+            item.comment = comment
+        if search is not None:
+            search.add(item)
         if done is not None:
-            item[3] = done
-        if parent is not None and parent != index[:-1]:
-            parentitem = self.data
-            for c in parent:
-                parentitem = parentitem[int(c) - 1][4]
-            parentitem.append(item)
-            parent = index[:-1]
-            parentitem = self.data
-            for c in parent:
-                parentitem = parentitem[int(c) - 1][4]
-            parentitem.remove(item)
+            item.done = done
+        if move:
+            self._move(item, target, siblings, position)
+        elif self._derivedAs is not None:
+            del siblings[position]
+            self._place(item, siblings, self._level(index) - 1, position)
+        self._dirty.add('items')
+
+    @save
+    @load
+    @logs
+    def move(self, indexes, parent=""):
+        """Moves items to the end of :parent:'s children.
+
+        All the items are found before any of them is moved, so
+        :indexes: refer to the list as it was before the call. Items end
+        up in :indexes: order, including those which already were
+        children of :parent:. Nothing is moved if any of the items
+        does not exist or :parent: is inside of one of them.
+
+        :indexes: List of indexes of the items to move.
+        :parent: New parent ("" for top level).
+
+        """
+        parent = self._split(parent)
+        indexes = [self._split(index) for index in indexes]
+        if self._detached():
+            if not self.storage.exists(parent):
+                raise NoItemError('.'.join(parent))
+            for i in indexes:
+                if not i or not self.storage.exists(i):
+                    raise NoItemError('.'.join(i))
+                if self.storage.within(i, parent):
+                    raise InvalidMoveError('.'.join(i), '.'.join(parent))
+            self._dirty.add('items')
+            return
+        target = None
+        if parent:
+            target = self._item(parent)
+        items = dict()
+        for index in indexes:
+            item = self._item(index)
+            if self._within(item, target):
+                raise InvalidMoveError('.'.join(index), '.'.join(parent))
+            items.setdefault(item.id, item)
+        for item in items.values():
+            self._move(item, target)
+        self._dirty.add('items')
 
     @save
     @load
@@ -233,17 +1320,23 @@ class Model(UserList):
         :index: Item's index.
 
         """
-        data = self.data
         index = self._split(index)
-        for j, c in enumerate(index):
-            i = int(c) - 1
-            if j + 1 == len(index):
-                try:
-                    del data[i]
-                except IndexError:
-                    raise NoItemError('.'.join(index))
-            else:
-                data = data[i][4]
+        if self._detached():
+            if not index or not self.storage.exists(index):
+                raise NoItemError('.'.join(index))
+            self._dirty.add('items')
+            return
+        try:
+            siblings, position, item = self._locate(index)
+        except (IndexError, KeyError, ValueError):
+            raise NoItemError('.'.join(index))
+        search = self._searchIndex(False)
+        if search is not None:
+            for v, _ in self._walk([item]):
+                search.discard(v)
+        del siblings[position]
+        self._index = None
+        self._dirty.add('items')
 
     @load
     def exists(self, index):
@@ -253,11 +1346,10 @@ class Model(UserList):
         :returns: True if :index: exists in the Model, False otherwise.
 
         """
-        data = self.data
+        if self._detached():
+            return self.storage.exists(self._split(index))
         try:
-            for c in self._split(index):
-                i = int(c) - 1
-                data = data[i][4]
+            self._children(self._split(index))
         except Exception:
             return False
         return True
@@ -271,14 +1363,70 @@ class Model(UserList):
         [parent, name, priority, comment, done, children].
 
         """
-        data = self.data
-        index2 = self._split(index)
-        for c in index2[:-1]:
-            i = int(c) - 1
-            data = data[i][4]
-        return [index[:-2] or ""] + data[int(index[-1]) - 1]
+        index = self._split(index)
+        if len(index) > 1:
+            parent = '.'.join(index[:-1])
+        elif index[0].startswith('@'):
+            parent = self._ids()[int(index[0][1:])][1]
+            parent = parent is not None and '@{}'.format(parent.id) or ""
+        else:
+            parent = ""
+        if self._detached():
+            return [parent] + self.storage.get(index)
+        item = self._locate(index)[2]
+        return [
+            parent, item.name, item.priority,
+            item.comment, item.done, item.children
+        ]
+
+    @load
+    def search(self, query):
+        """Finds items with all words of :query: in their name or comment.
+
+        Case is ignored and words of :query: also match longer words
+        starting with them (e.g. "mil" finds "milk"). Items are looked up
+        in the search index (see _searchIndex), which gets stored if it
+        had to be built or updated, so that next searches only read it.
+
+        :query: Text to look for.
+        :returns: List of (index, item) tuples, in the order of the list,
+        where index is a dotted one (e.g. "1.2").
 
-    def _modifyInternal(self, *, sort=None, purge=False, done=None):
+        """
+        search = self._searchIndex()
+        if (search.changed and self._searchAs is not None
+                and 'items' not in self._dirty):
+            search.write(self._paths()[0] + '.index', self._searchAs)
+        ids = self._ids()
+        # Kept until the data changes, like views
+        positions = self._views.setdefault('positions', dict())
+        found = list()
+        for id in search.find(query):
+            if id not in ids:
+                continue  # Gone without telling the index, e.g. purged
+            item, path = ids[id][0], list()
+            while item is not None:
+                parent = ids[item.id][1]
+                key = parent is not None and parent.id or 0
+                if key not in positions:
+                    siblings = self.data
+                    if parent is not None:
+                        siblings = parent.children
+                    positions[key] = dict(
+                        (v.id, i) for i, v in enumerate(siblings, start=1)
+                    )
+                path.append(positions[key][item.id])
+                item = parent
+            found.append((path[::-1], ids[id][0]))
+        found.sort(key=itemgetter(0))
+        return [
+            ('.'.join(str(i) for i in path), item) for path, item in found
+        ]
+
+    def _modifyInternal(
+        self, *, sort=None, purge=False, done=None, filter=None,
+        index=None, offset=0, limit=None, depth=None
+    ):
         """Creates a whole new database from existing one, based on given
         modifiers.
 
@@ -292,69 +1440,218 @@ class Model(UserList):
         :done: patterns looks similar to :sort:, except that it has additional
         <regexp> values and that True|False means to mark as done|undone.
 
+        :filter: pattern looks like :done: (without using True|False).
+        Only items matching it are kept, along with their ancestors.
+        Items are checked before anything is copied, so subtrees without
+        matches are neither copied nor sorted.
+
         @note: Should not be used directly. It was defined here, because
         :save: decorator needs undecorated version of Model.modify.
 
+        :index:, :offset:, :limit: and :depth: select a part of the database
+        to return. Only that part is built, so e.g. getting first few items
+        does not require sorting or copying whole database.
+
         :sort: Pattern on which to sort the database.
-        :purge: Whether to purge done items.
+        :purge: Whether to purge done items (including ones :done: marks).
         :done: Pattern on which to mark items as done/undone.
+        :filter: Pattern of items to keep.
+        :index: Index of an item to use as root (None for the whole database).
+        :offset: Number of root level items to skip.
+        :limit: Maximum number of root level items (None for no limit).
+        :depth: Maximum number of levels (None for no limit).
         :returns: New database, modified according to supplied arguments.
 
         """
-        sortAll, sortLevels = sort is not None and sort or ([], {})
-        doneAll, doneLevels = done is not None and done or ([], {})
+        sortAll, sortLevels = compileSort(sort)
+        _mark = compileMark(done)
+        _keep = filter is not None and compileFilter(filter) or None
 
-        def _mark(v, i):
-            if done is None:
-                return v[:4]
+        index = self._split(index) or []
+        root = self._children(index)
+        level = self._level(index)
+        last = depth is not None and level + depth - 1 or None
 
-            def _mark_(index, regexp, du):
-                if du is None:
-                    return v[:4]
-                if index is None:
-                    for v_ in v[:3]:
-                        if regexp is None or re.match(regexp, str(v_)):
-                            return v[:3] + [du]
-                    return v[:4]
-                if regexp is None or re.match(regexp, str(v[index])):
-                    return v[:3] + [du]
-            try:
-                for doneLevel in doneLevels[i]:
-                    result = _mark_(*doneLevel)
-                if result is not None:
-                    return result
-            except KeyError:
-                pass
-            for doneAll_ in doneAll:
-                result = _mark_(*doneAll_)
-            if result is None:
-                return v[:4]
-            return result
-
-        def _modify(submodel, i):
+        def _matches(submodel, i):
+            return any(
+                _keep(v, i) or _matches(v.children, i + 1)
+                for v in submodel if not purge or not _mark(v, i)
+            )
+
+        def _prune(submodel, i):
             _new = list()
             for v in submodel:
-                if purge:
-                    if not v[3]:
-                        _new.append(_mark(v, i) + [_modify(v[4], i + 1)])
+                done = _mark(v, i)
+                if purge and done:
+                    continue
+                if last is not None and i >= last:
+                    if not (_keep(v, i) or _matches(v.children, i + 1)):
+                        continue
+                    children = []
+                else:
+                    children = _modify(v.children, i + 1)
+                    if not children and not _keep(v, i):
+                        continue
+                _new.append(Item(
+                    v.name, v.priority, v.comment, done, children, v.id
+                ))
+            return _new
+
+        def _modify(submodel, i, offset=0, limit=None):
+            if _keep is not None:
+                _new = _prune(submodel, i)
+            else:
+                _new = [
+                    Item(
+                        v.name, v.priority, v.comment, _mark(v, i),
+                        v.children, v.id
+                    ) for v in submodel
+                ]
+                if purge:  # Items marked done just now go too
+                    _new = [v for v in _new if not v.done]
+            key, reverse = sortLevels.get(i) or sortAll
+            if limit is not None:
+                if key is not None:
+                    _new = (reverse and heapq.nlargest or heapq.nsmallest)(
+                        offset + limit, _new, key=key
+                    )
+                _new = _new[offset:offset + limit]
+            else:
+                if key is not None:
+                    _new.sort(key=key, reverse=reverse)
+                del _new[:offset]
+            if _keep is not None:
+                return _new  # Children are done already
+            for v in _new:
+                if last is not None and i >= last:
+                    v.children = []
                 else:
-                    _new.append(_mark(v, i) + [_modify(v[4], i + 1)])
-            levels = sortLevels.get(i) or sortLevels.get(str(i))
-            for index, reverse in levels or sortAll:
-                _new = sorted(_new, key=lambda e: e[index], reverse=reverse)
+                    v.children = _modify(v.children, i + 1)
             return _new
-        return _modify(self.data, 1)
+        return _modify(root, level, offset, limit)
 
     @load
-    def modify(self, *, sort=None, purge=False, done=None):
-        """Calls Model._modifyInternal after loading the database."""
-        return self._modifyInternal(sort=sort, purge=purge, done=done)
+    def modify(
+        self, *, sort=None, purge=False, done=None, filter=None,
+        index=None, offset=0, limit=None, depth=None
+    ):
+        """Calls Model._modifyInternal after loading the database.
+
+        Results are remembered until the data changes, so they are
+        shared between calls and must not be changed. Without any
+        modifiers, the data itself is returned.
+
+        """
+        if not (sort or purge or done or filter or offset
+                or depth is not None or limit is not None):
+            return self._children(self._split(index) or [])
+        key = json.dumps(
+            [sort, purge, done, filter, index, offset, limit, depth],
+            sort_keys=True
+        )
+        if key not in self._views:
+            self._views[key] = self._modifyInternal(
+                sort=sort, purge=purge, done=done, filter=filter,
+                index=index, offset=offset, limit=limit, depth=depth
+            )
+        return self._views[key]
 
     @save
     def modifyInPlace(self, *, sort=None, purge=False, done=None):
         """Like Model.modify, but changes existing database instead of
         returning a new one."""
         self.data = self.modify(sort=sort, purge=purge, done=done)
+        self._dirty.add('items')
+
+    @load
+    def exportItems(self, stream):
+        """Writes all items to :stream: as JSON Lines.
+
+        Every line holds a single item (parents go before their children)
+        as an object with 'index', 'id', 'name', 'priority', 'comment' and
+        'done' keys. Only one item is encoded at a time.
+
+        :stream: File-like object to write to.
+
+        """
+        def _export(items, prefix):
+            for i, item in enumerate(items, start=1):
+                index = prefix + str(i)
+                stream.write(json.dumps({
+                    'index': index,
+                    'id': item.id,
+                    'name': item.name,
+                    'priority': item.priority,
+                    'comment': item.comment,
+                    'done': item.done
+                }) + '\n')
+                _export(item.children, index + '.')
+        _export(self.data, '')
+
+    def importItems(self, stream, replace=False):
+        """Reads items written by exportItems from :stream:.
+
+        Items' indexes only tell which item is whose parent, so parents
+        have to go before their children. Imported items get new ids.
+        Whole stream is read before anything changes and it is applied
+        as a single change.
+
+        :stream: File-like object with JSON Lines to read.
+        :replace: Whether to replace all items instead of appending.
+        :returns: Number of imported items.
+
+        """
+        items = list()
+        nodes = {'': items}
+        count = 0
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                index = str(entry['index'])
+                children = list()
+                nodes[index.rpartition('.')[0]].append([
+                    str(entry['name']),
+                    int(entry.get('priority', 3)),
+                    str(entry.get('comment', "")),
+                    bool(entry.get('done', False)),
+                    children
+                ])
+            except (ValueError, KeyError, TypeError, AttributeError):
+                raise InvalidImportError(number)
+            nodes[index] = children
+            count += 1
+        self._import(items, replace)
+        return count
+
+    @save
+    @load
+    def _import(self, items, replace):
+        """Adds (or replaces with) already parsed :items:.
+
+        :items: List of items in JSON form.
+        :replace: Whether to replace all existing items.
+
+        """
+        items = Item.fromJSON(items)
+        self._newIds(items)
+        self._index = None
+        search = self._searchIndex(False)
+        if search is not None:
+            if replace:
+                search = self._search = Index()
+            for item, _ in self._walk(items):
+                search.add(item)
+        derivedAs = self._derivedAs
+        if replace:
+            self.data = items
+        else:
+            self.data.extend(items)
+        if derivedAs is not None:
+            self.data = self._modifyInternal(**self._permanent)
+            self._derivedAs = derivedAs
+        self._dirty.add('items')
 
     @save
     @load
@@ -365,10 +1662,13 @@ class Model(UserList):
         :kwargs: Dictionary of options and values to set.
 
         """
-        if glob:
-            self.globalOptions.update(kwargs)
-        else:
-            self.options.update(kwargs)
+        name, options = glob and (
+            'globalOptions', self.globalOptions
+        ) or ('options', self.options)
+        for k, v in kwargs.items():
+            if options.get(k, object()) != v:
+                options[k] = v
+                self._dirty.add(name)
 
     @load
     def __iter__(self):
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# This is a part of td @ http://github.com/KenjiTakahashi/td
+# Karol "Kenji Takahashi" Woźniak © 2012 - 2013
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Reads many ToDo lists at once, e.g. of all projects in a directory.
+
+Lists are read in parallel, by a pool of processes. Only counts of
+items are sent back by default and they are cached (see summarize),
+so that only lists which changed get read again.
+
+"""
+
+import os
+import marshal
+from td.model import Model, Item, devtodo
+from td.storage import signature, writeCache
+
+
+FILES = ('.td', '.td.journal', '.todo')
+# Cache of counts, by directory, for summarize
+CACHE = '~/.tdprojects'
+
+
+def find(root):
+    """Finds directories holding a td (or devtodo) list under :root:.
+
+    Hidden directories (e.g. .git) are not searched.
+
+    :root: Directory to start at.
+    :returns: Sorted list of paths of the directories (including :root:).
+
+    """
+    found = list()
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        if '.td' in filenames or '.todo' in filenames:
+            found.append(directory)
+    return sorted(found)
+
+
+def _stamp(directory, gpath):
+    """Gets a signature of the files a list in :directory: is read from.
+
+    :directory: Directory of the list.
+    :gpath: Path of the global options file.
+    :returns: See storage.signature.
+
+    """
+    return signature([os.path.join(directory, f) for f in FILES] + [gpath])
+
+
+def _items(directory, gpath):
+    """Reads items of the list in :directory:.
+
+    devtodo lists are only read, they are not turned into td lists.
+
+    :directory: Directory of the list.
+    :gpath: Path of the global options file.
+    :returns: List of Item instances.
+
+    """
+    path = os.path.join(directory, '.td')
+    if not os.path.exists(path):
+        return Item.fromJSON(devtodo(directory, save=False) or [])
+    model = Model()
+    model.setPath(path)
+    model.gpath = gpath
+    return list(model)
+
+
+def _read(args):
+    """Reads the list in a directory, in a pool process.
+
+    :args: A tuple of (directory, path of the global options file,
+    whether to return counts instead of items).
+    :returns: A tuple of (counts or items in JSON form, error message);
+    the first one is None if the list could not be read.
+
+    """
+    directory, gpath, count = args
+    try:
+        items = _items(directory, gpath)
+    except Exception as e:
+        return None, str(e)
+    if not count:
+        return Item.toJSON(items), None
+    counts = dict()
+    stack = list(items)
+    while stack:
+        item = stack.pop()
+        priority = item.priority
+        if isinstance(priority, str) and priority.isdigit():
+            priority = int(priority)  # As given in command line
+        counts.setdefault(priority, [0, 0])[bool(item.done)] += 1
+        stack.extend(item.children)
+    return counts, None
+
+
+def _map(args, jobs=None):
+    """Runs _read for every element of :args:.
+
+    A pool of processes is only started if there is more than one
+    list to read. multiprocessing is imported here, so that reading
+    a single list does not have to pay for it.
+
+    :args: List of _read arguments.
+    :jobs: Number of processes (None for the number of CPUs).
+    :returns: List of _read results, in order of :args:.
+
+    """
+    if len(args) < 2 or jobs == 1:
+        return [_read(a) for a in args]
+    import multiprocessing
+    with multiprocessing.Pool(jobs) as pool:
+        return pool.map(_read, args)
+
+
+def collect(root, gpath, jobs=None):
+    """Reads all the lists under :root:.
+
+    :root: Directory to start at, see find.
+    :gpath: Path of the global options file.
+    :jobs: Number of processes to read the lists with.
+    :returns: List of (directory, items, error message) tuples, where
+    items are Item instances (None if the list could not be read).
+
+    """
+    directories = find(root)
+    results = list()
+    for directory, (items, e) in zip(directories, _map(
+        [(d, gpath, False) for d in directories], jobs
+    )):
+        if items is not None:
+            items = Item.fromJSON(items)
+        results.append((directory, items, e))
+    return results
+
+
+def summarize(root, gpath, jobs=None, cache=CACHE):
+    """Counts items of all the lists under :root:.
+
+    Counts are cached (in a binary file, see CACHE) under signatures of
+    the files the lists were read from, so only lists which changed
+    since the last call get read again. Entries of lists which are not
+    under :root: anymore are dropped. Failing to write the cache is
+    ignored.
+
+    :root: Directory to start at, see find.
+    :gpath: Path of the global options file.
+    :jobs: Number of processes to read the lists with.
+    :cache: Path of the cache file (None for no caching).
+    :returns: List of (directory, counts, error message) tuples, where
+    counts is a dictionary of priority: [not done, done] (None if
+    the list could not be read).
+
+    """
+    directories = find(root)
+    # Taken before reading, so that lists changed meanwhile are read again
+    stamps = dict((d, _stamp(d, gpath)) for d in directories)
+    cached = dict()
+    if cache is not None:
+        cache = os.path.expanduser(cache)
+        try:
+            with open(cache, 'rb') as f:
+                cached = marshal.load(f)
+        except (IOError, EOFError, ValueError, TypeError):
+            pass
+    found = set(os.path.abspath(d) for d in directories)
+    prefix = os.path.join(os.path.abspath(root), '')
+    gone = [
+        key for key in cached
+        if key not in found and os.path.join(key, '').startswith(prefix)
+    ]
+    for key in gone:
+        del cached[key]
+    results = dict()
+    stale = list()
+    for directory in directories:
+        entry = cached.get(os.path.abspath(directory))
+        if entry is not None and entry[0] == stamps[directory]:
+            results[directory] = entry[1], None
+        else:
+            stale.append(directory)
+    for directory, (counts, e) in zip(
+        stale, _map([(d, gpath, True) for d in stale], jobs)
+    ):
+        results[directory] = counts, e
+        if counts is not None:
+            cached[os.path.abspath(directory)] = [stamps[directory], counts]
+    if (stale or gone) and cache is not None:
+        writeCache(cache, cached)
+    return [(d,) + results[d] for d in directories]
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# This is a part of td @ http://github.com/KenjiTakahashi/td
+# Karol "Kenji Takahashi" Woźniak © 2012 - 2013
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import re
+import marshal
+from array import array
+from bisect import bisect_left
+from td.storage import writeCache
+
+
+WORD = re.compile(r'\w+')
+
+
+def words(text):
+    """Splits :text: into words, ignoring case.
+
+    :text: Text to split.
+    :returns: List of lowercase words, in order of appearance.
+
+    """
+    return WORD.findall(text.casefold())
+
+
+class Index(object):
+    """Inverted index of words found in items' names and comments.
+
+    Maps every word to a set of ids of items containing it. Ids never
+    change (nor are reused), so the index stays valid when items get
+    sorted or moved and only has to follow changes of their texts.
+
+    It may be stored in a binary (marshal) file, under a key telling
+    which version of the database it was built for. Ids are stored as
+    packed arrays, which are turned into sets only for words actually
+    looked up or changed, so reading the index costs about as much as
+    reading the file.
+
+    """
+
+    def __init__(self, postings=None):
+        """Creates new Index instance.
+
+        :postings: Dictionary of word: set of ids or packed array of ids
+        (empty if None).
+
+        """
+        if postings is None:
+            postings = dict()
+        self.postings = postings
+        self.changed = False
+        self._words = None
+
+    @classmethod
+    def build(cls, items):
+        """Creates new index of :items:.
+
+        :items: Iterable of items (their children are not included).
+        :returns: Index instance.
+
+        """
+        index = cls()
+        for item in items:
+            index.add(item)
+        return index
+
+    @classmethod
+    def read(cls, path, key):
+        """Reads index stored under :key: from :path:.
+
+        :path: Path of the index file.
+        :key: Key the index has to be stored under.
+        :returns: Index instance, or None if there is no such index.
+
+        """
+        try:
+            with open(path, 'rb') as f:
+                ikey, postings = marshal.load(f)
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+        if ikey != [marshal.version, key]:
+            return None
+        return cls(postings)
+
+    def write(self, path, key):
+        """Stores the index at :path:, under :key:.
+
+        Index can always be built again, so failing to write it is
+        ignored.
+
+        :path: Path of the index file.
+        :key: Key to store the index under, see read.
+
+        """
+        if writeCache(path, [[marshal.version, key], dict(
+            (word, self._pack(ids)) for word, ids in self.postings.items()
+        )]):
+            self.changed = False
+
+    def _text(self, item):
+        return set(words("{} {}".format(item.name, item.comment)))
+
+    def _pack(self, ids):
+        if isinstance(ids, bytes):
+            return ids
+        return array('q', sorted(ids)).tobytes()
+
+    def _ids(self, word):
+        """Gets ids of items containing :word:, as a set.
+
+        :word: Word to look up.
+        :returns: Set of ids (which may be changed), None if there is none.
+
+        """
+        ids = self.postings.get(word)
+        if isinstance(ids, bytes):
+            packed, ids = ids, array('q')
+            ids.frombytes(packed)
+            ids = self.postings[word] = set(ids)
+        return ids
+
+    def add(self, item):
+        """Adds words of :item:'s name and comment to the index.
+
+        :item: Item to add (its children are not included).
+
+        """
+        for word in self._text(item):
+            ids = self._ids(word)
+            if ids is None:
+                ids = self.postings[word] = set()
+                self._words = None
+            ids.add(item.id)
+        self.changed = True
+
+    def discard(self, item):
+        """Removes words of :item:'s name and comment from the index.
+
+        :item: Item to remove, with the texts it was added with.
+
+        """
+        for word in self._text(item):
+            ids = self._ids(word)
+            if ids is not None:
+                ids.discard(item.id)
+                if not ids:
+                    del self.postings[word]
+                    self._words = None
+        self.changed = True
+
+    def find(self, query):
+        """Finds items containing all words of :query:.
+
+        Every word of :query: matches words starting with it, so e.g.
+        "mil" finds "milk". Words are looked up by bisecting a sorted
+        list of all the words, so it costs as much as the number of
+        matching words, not the size of the index.
+
+        :query: Text to look for.
+        :returns: Set of ids of matching items (empty for empty query).
+
+        """
+        if self._words is None:
+            self._words = sorted(self.postings)
+        found = None
+        for prefix in set(words(query)):
+            ids = set()
+            i = bisect_left(self._words, prefix)
+            while (i < len(self._words)
+                   and self._words[i].startswith(prefix)):
+                ids |= self._ids(self._words[i])
+                i += 1
+            if found is not None:
+                ids &= found
+            found = ids
+            if not found:
+                return set()
+        return found or set()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# This is a part of td @ http://github.com/KenjiTakahashi/td
+# Karol "Kenji Takahashi" Woźniak © 2012 - 2014
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""td server, keeping lists in memory between td calls."""
+
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+from td.client import address
+from td.main import Arg, Get, NotInteractiveError
+from td.model import Model
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """Handles a single forwarded td command."""
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:  # Just checking whether the server is alive
+            return
+        request = json.loads(line.decode('utf-8'))
+        response = self.server.execute(**request)
+        self.wfile.write(json.dumps(response).encode('utf-8'))
+
+
+class Server(socketserver.UnixStreamServer):
+    """Runs td commands sent by td.client, one at a time.
+
+    Every list gets its own resident Model, which is read again only if
+    its files change (e.g. when edited by other programs).
+
+    """
+
+    def __init__(self, path):
+        """Creates new Server instance.
+
+        :path: Path of the socket to listen on.
+
+        """
+        self.models = dict()
+        super().__init__(path, Handler)
+        os.chmod(path, 0o600)
+
+    def model(self, cwd, home):
+        """Gets a Model for the list in :cwd:.
+
+        :cwd: Directory of the list.
+        :home: Home directory of the user (with .tdrc).
+        :returns: Resident Model instance.
+
+        """
+        path = os.path.join(cwd, '.td')
+        model = self.models.get(path)
+        if model is None:
+            model = self.models[path] = Model()
+            model.resident = True
+            model.setPath(path)
+            model.gpath = os.path.join(home, '.tdrc')
+        return model
+
+    def execute(self, argv, cwd, home):
+        """Runs a single td command.
+
+        :argv: Command line arguments (including program name).
+        :cwd: Working directory of the client.
+        :home: Home directory of the user.
+        :returns: A dictionary with 'status' ('ok' or 'local', if the
+        command needs user input and has to be run by the client itself)
+        and the command's 'stdout' and 'stderr'.
+
+        """
+        model = self.model(cwd, home)
+        streams = sys.stdout, sys.stderr, sys.argv
+        sys.stdout, sys.stderr, sys.argv = io.StringIO(), io.StringIO(), argv
+        directory = os.getcwd()
+        os.chdir(cwd)  # Relative paths in arguments are the client's
+        try:
+            with model.session():
+                Arg(model)
+            return {
+                'status': 'ok',
+                'stdout': sys.stdout.getvalue(),
+                'stderr': sys.stderr.getvalue()
+            }
+        except NotInteractiveError:
+            return {'status': 'local'}
+        finally:
+            os.chdir(directory)
+            sys.stdout, sys.stderr, sys.argv = streams
+
+
+def serve(path=None):
+    """Runs td server until interrupted.
+
+    :path: Path of the socket, defaults to td.client.address().
+
+    """
+    path = path or address()
+    if os.path.exists(path):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except OSError:
+            os.remove(path)  # Left by a server which did not exit cleanly
+        else:
+            logging.getLogger('td').error(
+                "td server is already running at [{}].".format(path)
+            )
+            return
+        finally:
+            sock.close()
+    Get.interactive = False
+    server = Server(path)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(path)
@@ -0,0 +1,868 @@
+# -*- coding: utf-8 -*-
+# This is a part of td @ http://github.com/KenjiTakahashi/td
+# Karol "Kenji Takahashi" Woźniak © 2012 - 2014
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import json
+import marshal
+from contextlib import contextmanager
+
+
+class UnknownStorageError(Exception):
+    def __init__(self, k):
+        self.message = "Unknown storage engine [{}].".format(k)
+
+    def __str__(self):
+        return self.message
+
+
+NOSYNC, FSYNC, DIRSYNC = "none", "fsync", "dirsync"
+OPTIMISTIC, EXCLUSIVE = "optimistic", "exclusive"
+
+
+@contextmanager
+def lock(path):
+    """Holds an exclusive advisory lock on :path: for the time of the block.
+
+    The lock is taken on a separate :path:.lock file, because the database
+    file itself gets replaced on every write. Waits for other holders to
+    release it first. Does nothing on systems without fcntl.
+
+    :path: Path of the database file.
+
+    """
+    try:
+        import fcntl  # Not available everywhere
+    except ImportError:
+        yield
+        return
+    fd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # Releases the lock as well
+
+
+def tempfor(path):
+    """Creates a temporary file next to :path:.
+
+    :path: Path of the file, which the temporary one will replace.
+    :returns: A tuple of (file descriptor, temporary file path).
+
+    """
+    return tempfile.mkstemp(
+        prefix='.{}.'.format(os.path.basename(path)),
+        dir=os.path.dirname(path) or '.'
+    )
+
+
+def replace(tmppath, path, durability=FSYNC, backup=None):
+    """Atomically moves :tmppath: over :path:.
+
+    The file mode of :path: is preserved and the previous version is kept
+    under :backup: by hard linking (falling back to a copy on file systems
+    without links).
+
+    :tmppath: Path of the new, complete file.
+    :path: Path of the file to replace.
+    :durability: One of NOSYNC (leave flushing to the OS), FSYNC (sync file
+    contents) or DIRSYNC (also sync the directory entry).
+    :backup: Path to keep the previous version at (None for no backup).
+
+    """
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    os.chmod(tmppath, mode)
+    if backup is not None and os.path.exists(path):
+        try:
+            os.remove(backup)
+        except OSError:
+            pass
+        try:
+            os.link(path, backup)
+        except OSError:
+            shutil.copy2(path, backup)
+    os.replace(tmppath, path)
+    if durability == DIRSYNC:
+        dirfd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+        try:
+            os.fsync(dirfd)
+        finally:
+            os.close(dirfd)
+
+
+def write(path, content, durability=FSYNC, backup=None):
+    """Atomically replaces contents of :path: with :content:.
+
+    Data goes to a temporary file first, which is then renamed over :path:
+    (see replace), so a crash in the middle leaves either old or new
+    contents intact.
+
+    :path: Path of the file to write.
+    :content: String to write, or a callable writing the contents to
+    the file it is given (e.g. dump), so that they need not be built
+    as a single string.
+    :durability: Durability level, see replace.
+    :backup: Path to keep the previous version at (None for no backup).
+
+    """
+    fd, tmppath = tempfor(path)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            if callable(content):
+                content(f)
+            else:
+                f.write(content)
+            if durability != NOSYNC:
+                f.flush()
+                os.fsync(f.fileno())
+        replace(tmppath, path, durability, backup)
+    except BaseException:
+        try:
+            os.remove(tmppath)
+        except OSError:
+            pass
+        raise
+
+
+def dump(document, f, chunk=1000):
+    """Writes :document: to :f: as JSON, a piece at a time.
+
+    Items are encoded :chunk: top-level items at a time, so the whole
+    document is never held as a single string. Unlike json.dump, this
+    keeps using the C encoder, which is several times faster.
+
+    :document: Dictionary to write, with an 'items' list.
+    :f: File opened for writing text.
+    :chunk: Number of top-level items to encode at once.
+
+    """
+    f.write('{')
+    for j, (key, value) in enumerate(document.items()):
+        f.write(j and ', ' or '')
+        f.write(json.dumps(key) + ': ')
+        if key != 'items':
+            f.write(json.dumps(value))
+            continue
+        f.write('[')
+        for i in range(0, len(value), chunk):
+            f.write(i and ', ' or '')
+            f.write(json.dumps(value[i:i + chunk])[1:-1])
+        f.write(']')
+    f.write('}')
+
+
+def writeCache(path, value):
+    """Atomically stores :value: in a binary (marshal) file at :path:.
+
+    Caches can always be built again, so failing to write is ignored.
+
+    :path: Path of the cache file.
+    :value: Value to store (of types marshal supports).
+    :returns: True if the file was written, False otherwise.
+
+    """
+    try:
+        fd, tmppath = tempfor(path)
+    except OSError:
+        return False
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            marshal.dump(value, f)
+        replace(tmppath, path, NOSYNC)
+    except (OSError, ValueError):
+        try:
+            os.remove(tmppath)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def signature(paths):
+    """Gets a signature of files, telling whether they have changed.
+
+    :paths: List of paths of the files.
+    :returns: A list of (inode, size, mtime, ctime) tuples
+    (None for files which do not exist).
+
+    """
+    stamp = list()
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            stamp.append(None)
+        else:
+            stamp.append(
+                (st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+            )
+    return stamp
+
+
+class JSONStorage(object):
+    """Keeps the whole database in a single JSON document.
+
+    Every save rewrites the whole document.
+
+    JSON file is the only source of truth, but its parsed contents are
+    also cached in a binary (marshal) file next to it, keyed on the JSON
+    file's inode, size and times. Reads use the cache while it is fresh
+    and fall back to parsing JSON (refreshing the cache) otherwise.
+    Set JSONStorage.cache to False to disable it.
+
+    Document carries a version number, increased on every write, which
+    tells whether someone else wrote the database in the meantime
+    (see changed).
+
+    """
+
+    queries = False
+    cache = True
+
+    def __init__(self, path, durability=FSYNC):
+        """Creates new JSONStorage instance.
+
+        :path: Path of the database file.
+        :durability: Durability level used for writing, see write.
+
+        """
+        self.path = path
+        self.durability = durability
+        self.cpath = path + '.cache'
+        self.files = [path]
+        self.version = 0
+        self.stamp = None
+
+    def read(self):
+        """Reads the database.
+
+        Also remembers its version, see changed.
+
+        :returns: A tuple of (document, operations), where document is
+        a dictionary with 'items', 'refs' and 'options' keys (or None if
+        the database does not exist yet) and operations is a list of
+        [name, args, kwargs] changes to apply on top of it.
+
+        """
+        self.stamp = self._stamp()
+        self.version = 0
+        try:
+            key = self._key()
+        except OSError:
+            return None, []
+        if self.cache:
+            try:
+                with open(self.cpath, 'rb') as f:
+                    ckey, document = marshal.load(f)
+            except (IOError, EOFError, ValueError, TypeError):
+                pass
+            else:
+                if ckey == key:
+                    self.version = document.get('version', 0)
+                    return document, []
+        try:
+            document = json.loads(open(self.path).read())
+        except IOError:
+            return None, []
+        self._cache(key, document)
+        self.version = document.get('version', 0)
+        return document, []
+
+    def write(self, document, operations):
+        """Writes the database.
+
+        It should be called with the database locked (see lock).
+
+        :document: Callable returning the whole database document.
+        :operations: Changes made since the last read or write.
+
+        """
+        document = dict(document(), version=self.version + 1)
+        write(self.path, lambda f: dump(document, f), self.durability,
+              os.path.join(os.path.dirname(self.path), '.td~'))
+        self.version = document['version']
+        self.stamp = self._stamp()
+        # Items are JSON native already, but refs and options may contain
+        # tuples or integer keys, which JSON would not preserve.
+        self._cache(self._key(), dict(document, **json.loads(json.dumps({
+            'refs': document['refs'], 'options': document['options']
+        }))))
+
+    def changed(self):
+        """Checks whether someone else wrote the database.
+
+        That is, since it was last read or written by this instance.
+        Files are compared by their signatures first, version is only
+        read if they differ.
+
+        :returns: True if the database has changed, False otherwise.
+
+        """
+        if self._stamp() == self.stamp:
+            return False
+        storage = getStorage(self.path, self.durability)
+        storage.read()
+        return (type(storage) is not type(self)
+                or storage.version != self.version)
+
+    def _stamp(self):
+        """Gets a signature of the files holding the database.
+
+        :returns: See signature.
+
+        """
+        return signature(self.files)
+
+    def _key(self):
+        """Gets cache key of the JSON file.
+
+        :returns: A tuple identifying current version of the JSON file.
+
+        """
+        stat = os.stat(self.path)
+        return (marshal.version, stat.st_ino, stat.st_size,
+                stat.st_mtime_ns, stat.st_ctime_ns)
+
+    def _cache(self, key, document):
+        """Stores :document: in the cache, under :key:.
+
+        Cache is only an optimization, so failing to write it is ignored.
+
+        :key: Cache key, see _key.
+        :document: Parsed JSON document.
+
+        """
+        if self.cache:
+            writeCache(self.cpath, (key, document))
+
+    def drop(self):
+        """Removes files used exclusively by this engine."""
+        pass
+
+
+class JournalStorage(JSONStorage):
+    """Keeps a JSON snapshot and an append-only journal of changes.
+
+    Every save only appends new operations to the journal, one JSON line
+    each. Once the journal grows past JournalStorage.threshold bytes,
+    it gets compacted into a new snapshot.
+
+    Snapshot and journal carry a generation number, so that a journal
+    which has already been compacted (e.g. after a crash in the middle of
+    compaction) is never applied twice. Trailing, partially written
+    operation is ignored.
+
+    Version of the database is the snapshot's version plus the number of
+    operations in the journal.
+
+    """
+
+    threshold = 1 << 20
+
+    def __init__(self, path, durability=FSYNC):
+        super().__init__(path, durability)
+        self.jpath = path + '.journal'
+        self.files.append(self.jpath)
+        self.generation = None
+
+    def read(self):
+        document, operations = super().read()
+        self.generation = document and document.get('generation')
+        try:
+            lines = open(self.jpath).read().splitlines()
+        except IOError:
+            return document, operations
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            return document, operations
+        if document is None or header.get('generation') != self.generation:
+            return document, operations
+        for line in lines[1:]:
+            try:
+                operations.append(json.loads(line))
+            except ValueError:
+                break
+        self.version += len(operations)
+        return document, operations
+
+    def write(self, document, operations):
+        try:
+            size = os.path.getsize(self.jpath)
+        except OSError:
+            size = None
+        if (self.generation is None or size is None or not operations
+                or size > self.threshold):
+            return self.compact(document())
+        fd = os.open(self.jpath, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, ''.join(
+                json.dumps(operation) + '\n' for operation in operations
+            ).encode('utf-8'))
+            if self.durability != NOSYNC:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.version += len(operations)
+        self.stamp = self._stamp()
+
+    def compact(self, document):
+        """Writes :document: as a new snapshot and starts a new journal.
+
+        :document: The whole database document.
+
+        """
+        self.generation = (self.generation or 0) + 1
+        document = dict(document, generation=self.generation)
+        super().write(lambda: document, [])
+        write(self.jpath, json.dumps({'generation': self.generation}) + '\n',
+              self.durability)
+        self.stamp = self._stamp()
+
+    def drop(self):
+        try:
+            os.remove(self.jpath)
+        except OSError:
+            pass
+
+
+def _split(index):
+    """Splits :index: by '.', removing empty strings.
+
+    :index: Index to split.
+    :returns: List of index parts.
+
+    """
+    return [c for c in index.split('.') if c]
+
+
+class SQLiteStorage(object):
+    """Keeps the database in SQLite, one row per item.
+
+    Items are stored as (id, parent_id, position, name, priority, comment,
+    done) rows, with top level items having parent_id 0, so that single
+    items can be looked up by index without reading the whole database.
+
+    Changes are applied as recorded operations, in a single transaction,
+    falling back to rewriting all rows for operations which cannot be
+    expressed that way (e.g. modifyInPlace).
+
+    Version of the database is kept in the meta table.
+
+    """
+
+    queries = True
+    HEADER = b'SQLite format 3\x00'
+    SYNCHRONOUS = {NOSYNC: 'OFF', FSYNC: 'FULL', DIRSYNC: 'EXTRA'}
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS items (
+            id INTEGER PRIMARY KEY,
+            parent_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            name TEXT,
+            priority,
+            comment TEXT,
+            done INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS items_position
+            ON items (parent_id, position);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, path, durability=FSYNC):
+        """Creates new SQLiteStorage instance.
+
+        :path: Path of the database file.
+        :durability: Durability level used for writing, see write.
+
+        """
+        self.path = path
+        self.durability = durability
+        self.version = 0
+        self._conn = None
+
+    @classmethod
+    def detect(cls, path):
+        """Checks whether :path: is an SQLite database.
+
+        :path: Path to check.
+        :returns: True if :path: is an SQLite database, False otherwise.
+
+        """
+        try:
+            with open(path, 'rb') as f:
+                return f.read(len(cls.HEADER)) == cls.HEADER
+        except IOError:
+            return False
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = self._connect(self.path)
+        return self._conn
+
+    def _connect(self, path):
+        import sqlite3  # Only needed by this engine
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA synchronous = {}'.format(
+            SQLiteStorage.SYNCHRONOUS[self.durability]
+        ))
+        conn.executescript(SQLiteStorage.SCHEMA)
+        return conn
+
+    def read(self):
+        if not SQLiteStorage.detect(self.path):
+            return None, []
+        meta = dict(
+            (k, json.loads(v))
+            for k, v in self.conn.execute('SELECT key, value FROM meta')
+        )
+        refs = meta.get('refs', {})
+        self.version = meta.get('version', 0)
+        return {
+            'items': lambda: self.items(refs),
+            'refs': refs,
+            'options': meta.get('options', {})
+        }, []
+
+    def items(self, refs=None):
+        """Reads all the items.
+
+        Row ids serve as item ids, they are not stored in refs.
+
+        :refs: Dictionary to put item ids to (as 'ids' list, in the same
+        order as in JSON document's refs).
+        :returns: Items tree, in the same format as in JSON document.
+
+        """
+        nodes = dict()
+        rows = self.conn.execute(
+            'SELECT id, parent_id, name, priority, comment, done'
+            ' FROM items ORDER BY parent_id, position'
+        ).fetchall()
+        for id, _, name, priority, comment, done in rows:
+            nodes[id] = [name, priority, comment, bool(done), []]
+        children = {0: list()}
+        for id, parent, *_ in rows:
+            children.setdefault(parent, list()).append(id)
+            if parent:
+                nodes[parent][4].append(nodes[id])
+        if refs is not None:
+            refs['ids'] = ids = list()
+            stack = [iter(children[0])]
+            while stack:
+                id = next(stack[-1], None)
+                if id is None:
+                    stack.pop()
+                    continue
+                ids.append(id)
+                stack.append(iter(children.get(id, ())))
+        return [nodes[id] for id in children[0]]
+
+    def find(self, index):
+        """Finds id of an item.
+
+        :index: Index of the item, split into parts.
+        :returns: Item's id (0 for top level) or None if it does not exist.
+
+        """
+        id = 0
+        for j, c in enumerate(index):
+            try:
+                if j == 0 and c.startswith('@'):
+                    row = self.conn.execute(
+                        'SELECT id FROM items WHERE id = ?', (int(c[1:]),)
+                    ).fetchone()
+                    if row is None:
+                        return None
+                    id = row[0]
+                    continue
+                position = int(c) - 1
+            except ValueError:
+                return None
+            row = self.conn.execute(
+                'SELECT id FROM items WHERE parent_id = ? AND position = ?',
+                (id, position)
+            ).fetchone()
+            if row is None:
+                return None
+            id = row[0]
+        return id
+
+    def exists(self, index):
+        """Checks whether an item exists.
+
+        :index: Index of the item, split into parts.
+        :returns: True if the item exists, False otherwise.
+
+        """
+        return self.find(index) is not None
+
+    def get(self, index):
+        """Gets an item with all its children.
+
+        :index: Index of the item, split into parts.
+        :returns: A list in form [name, priority, comment, done, children].
+
+        """
+        id = self.find(index)
+        if not id:
+            raise IndexError(index)
+
+        def _get(id):
+            name, priority, comment, done = self.conn.execute(
+                'SELECT name, priority, comment, done FROM items'
+                ' WHERE id = ?', (id,)
+            ).fetchone()
+            return [name, priority, comment, bool(done), [
+                _get(child) for child, in self.conn.execute(
+                    'SELECT id FROM items WHERE parent_id = ?'
+                    ' ORDER BY position', (id,)
+                ).fetchall()
+            ]]
+        return _get(id)
+
+    def _count(self, parent):
+        return self.conn.execute(
+            'SELECT COUNT(*) FROM items WHERE parent_id = ?', (parent,)
+        ).fetchone()[0]
+
+    def _detach(self, id):
+        """Closes the gap left after item :id: in its parent."""
+        parent, position = self.conn.execute(
+            'SELECT parent_id, position FROM items WHERE id = ?', (id,)
+        ).fetchone()
+        self.conn.execute(
+            'UPDATE items SET position = position - 1'
+            ' WHERE parent_id = ? AND position > ?', (parent, position)
+        )
+
+    def _append(self, id, parent):
+        """Moves item :id: to the end of :parent:'s children."""
+        self._detach(id)
+        self.conn.execute(
+            'UPDATE items SET parent_id = ?, position = ('
+            'SELECT COUNT(*) FROM items WHERE parent_id = ? AND id != ?'
+            ') WHERE id = ?', (parent, parent, id, id)
+        )
+
+    def within(self, index, parent):
+        """Checks whether :parent: is the item at :index: or its child.
+
+        :index: Index of the item, split into parts.
+        :parent: Index of the other item, split into parts.
+        :returns: True if :parent: is inside of the item.
+
+        """
+        return self.conn.execute(
+            'WITH RECURSIVE ancestors(id) AS (SELECT ? UNION ALL'
+            ' SELECT items.parent_id FROM items'
+            ' JOIN ancestors ON items.id = ancestors.id)'
+            ' SELECT 1 FROM ancestors WHERE id = ?',
+            (self.find(parent), self.find(index))
+        ).fetchone() is not None
+
+    def _refs(self):
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'refs'"
+        ).fetchone()
+        return row and json.loads(row[0]) or dict()
+
+    def add(self, name, priority=3, comment="", parent=""):
+        # Same id as Model.add gives
+        refs = self._refs()
+        id = self.conn.execute(
+            'SELECT MAX(COALESCE(MAX(id), 0) + 1, ?) FROM items',
+            (refs.get('next', 1),)
+        ).fetchone()[0]
+        parent = self.find(_split(parent))
+        self.conn.execute(
+            'INSERT INTO items'
+            ' (id, parent_id, position, name, priority, comment, done)'
+            ' VALUES (?, ?, ?, ?, ?, ?, 0)',
+            (id, parent, self._count(parent), name, priority, comment)
+        )
+        refs['next'] = id + 1
+        self._setMeta(self.conn, 'refs', refs)
+
+    def edit(
+        self, index, name=None, priority=None,
+        comment=None, done=None, parent=None
+    ):
+        index = _split(index)
+        id = self.find(index)
+        for field, value in [
+            ('name', name), ('priority', priority),
+            ('comment', comment), ('done', done)
+        ]:
+            if value is not None:
+                self.conn.execute(
+                    'UPDATE items SET {} = ? WHERE id = ?'.format(field),
+                    (value, id)
+                )
+        if parent == -1:
+            parent = ''
+        if parent is None:
+            return
+        parent = self.find(_split(parent))
+        if parent != self.conn.execute(
+            'SELECT parent_id FROM items WHERE id = ?', (id,)
+        ).fetchone()[0]:
+            self._append(id, parent)
+
+    def move(self, indexes, parent=""):
+        ids = [self.find(_split(index)) for index in indexes]
+        parent = self.find(_split(parent))
+        for id in dict.fromkeys(ids):
+            self._append(id, parent)
+
+    def remove(self, index):
+        id = self.find(_split(index))
+        self._detach(id)
+        self.conn.execute(
+            'WITH RECURSIVE subtree(id) AS (SELECT ? UNION ALL'
+            ' SELECT items.id FROM items'
+            ' JOIN subtree ON items.parent_id = subtree.id)'
+            ' DELETE FROM items WHERE id IN subtree', (id,)
+        )
+
+    def setOptions(self, glob=False, **kwargs):
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'options'"
+        ).fetchone()
+        options = row and json.loads(row[0]) or dict()
+        options.update(kwargs)
+        self._setMeta(self.conn, 'options', options)
+
+    def _setMeta(self, conn, key, value):
+        conn.execute(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+            (key, json.dumps(value))
+        )
+
+    def _rewrite(self, conn, document):
+        """Replaces all the data in :conn: with :document:."""
+        conn.execute('DELETE FROM items')
+        refs = dict(document['refs'])
+        ids = iter(refs.pop('ids', ()))
+
+        def _rows(items, parent):
+            for position, (name, priority, comment, done, children) in \
+                    enumerate(items):
+                id = conn.execute(
+                    'INSERT INTO items'
+                    ' (id, parent_id, position, name, priority, comment, done)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (next(ids, None), parent, position,
+                     name, priority, comment, done)
+                ).lastrowid
+                _rows(children, id)
+        _rows(document['items'], 0)
+        self._setMeta(conn, 'refs', refs)
+        self._setMeta(conn, 'options', document['options'])
+
+    def write(self, document, operations):
+        if not SQLiteStorage.detect(self.path):
+            return self.create(document())
+        with self.conn:
+            if not operations or any(
+                name not in ['add', 'edit', 'move', 'remove', 'setOptions']
+                for name, _, _ in operations
+            ):
+                self._rewrite(self.conn, document())
+            else:
+                for name, args, kwargs in operations:
+                    getattr(self, name)(*args, **kwargs)
+            self._setMeta(self.conn, 'version', self.version + 1)
+        self.version += 1
+
+    def changed(self):
+        if not SQLiteStorage.detect(self.path):
+            return True
+        storage = SQLiteStorage(self.path, self.durability)
+        try:
+            storage.read()
+        finally:
+            storage.drop()
+        return storage.version != self.version
+
+    def create(self, document):
+        """Creates a new database from :document:.
+
+        The database is built in a temporary file and then moved into
+        place, so an existing database (e.g. JSON one being migrated)
+        stays intact until the new one is complete. It is then kept
+        as a backup.
+
+        :document: The whole database document.
+
+        """
+        fd, tmppath = tempfor(self.path)
+        os.close(fd)
+        try:
+            conn = self._connect(tmppath)
+            try:
+                with conn:
+                    self._rewrite(conn, document)
+                    self._setMeta(conn, 'version', self.version + 1)
+            finally:
+                conn.close()
+            replace(tmppath, self.path, self.durability,
+                    os.path.join(os.path.dirname(self.path), '.td~'))
+        except BaseException:
+            os.remove(tmppath)
+            raise
+        self.version += 1
+        self.drop()
+
+    def drop(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+ENGINES = {
+    'json': JSONStorage,
+    'journal': JournalStorage,
+    'sqlite': SQLiteStorage
+}
+
+
+def getStorage(path, durability=FSYNC):
+    """Creates storage engine instance used by database at :path:.
+
+    :path: Path of the database file.
+    :durability: Durability level used for writing, see write.
+    :returns: Storage engine instance.
+
+    """
+    if SQLiteStorage.detect(path):
+        return SQLiteStorage(path, durability)
+    if os.path.exists(path + '.journal'):
+        return JournalStorage(path, durability)
+    return JSONStorage(path, durability)
@@ -17,8 +17,10 @@
 
 
 import logging
+import os
 import sys
 from io import StringIO
+from td.model import Item
 
 
 class HandlerMock(logging.Handler):
@@ -63,6 +65,13 @@ class ModelMock(object):
         self.done_val = False
         self.undone_val = False
         self.options_val = False
+        self.storage_val = None
+        self.discard_val = False
+        self.add_kwargs = None
+        self.gpath = os.path.expanduser("~/.tdrc")
+
+    def _paths(self):
+        return os.path.join(os.getcwd(), ".td"), self.gpath
 
     def get(self, index):
         return [1, 1, 1, 1, 1]
@@ -70,14 +79,20 @@ class ModelMock(object):
     def exists(self, index):
         return True
 
-    def modify(self, sort, purge, done):
+    def modify(self, sort, purge, done, **kwargs):
         self.modify_val = True
+        self.modify_kwargs = kwargs
+        return []
 
     def modifyInPlace(self, sort, purge, done):
         self.modifyInPlace_val = True
 
-    def add(self, name, priority, comment, parent):
+    def add(self, name, priority=3, comment="", parent=""):
         self.add_val = True
+        self.add_kwargs = {
+            "name": name, "priority": priority,
+            "comment": comment, "parent": parent
+        }
 
     def edit(
         self, index=None, name=None, priority=None,
@@ -92,9 +107,29 @@ class ModelMock(object):
     def remove(self, index):
         self.rm_val = True
 
+    def move(self, indexes, parent=""):
+        self.move_val = (indexes, parent)
+
+    def search(self, query):
+        self.search_val = query
+        item = Item("found", 3, "", False, [])
+        return [("1.2", item)]
+
     def setOptions(self, glob, **kwargs):
         self.options_val = True
 
+    def setStorage(self, engine):
+        self.storage_val = engine
+
+    def discard(self):
+        self.discard_val = True
+
+    def exportItems(self, stream):
+        stream.write("mock\n")
+
+    def importItems(self, stream, replace=False):
+        self.import_val = (stream.read(), replace)
+
 
 class ArgMock(object):
     def __init__(self):
@@ -115,6 +150,15 @@ class ArgMock(object):
     def rm(self):
         pass
 
+    def move(self):
+        pass
+
+    def search(self):
+        pass
+
+    def recursive(self):
+        pass
+
     def done(self):
         pass
 
@@ -124,6 +168,15 @@ class ArgMock(object):
     def options(self):
         pass
 
+    def batch(self):
+        pass
+
+    def exportItems(self):
+        pass
+
+    def importItems(self):
+        pass
+
 
 class GetMock(object):
     def get(self, field, value):
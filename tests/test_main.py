@@ -17,8 +17,84 @@
 
 
 from collections import deque
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 from tests.mocks import HandlerMock, StdoutMock, ArgMock, ModelMock, GetMock
-from td.main import Arg, Parser, Get
+from td.main import Arg, Parser, Get, View, run
+from td.model import Item, Model
+from td.storage import NOSYNC, DIRSYNC
+
+
+class TestView(object):
+    def setUp(self):
+        self.mock = StdoutMock()
+        self.model = [
+            Item("testname1", 4, "testcomment", True, [
+                Item("testname2", 3, "", False, [])
+            ])
+        ] + [Item("testname", 0, "", False, []) for _ in range(9)]
+
+    def tearDown(self):
+        self.mock.undo()
+
+    def test_no_color(self):
+        View(self.model, nocolor=True)
+        self.mock.assertEqual(
+            " 1-testname1\n"
+            "   (testcomment)\n"
+            "   1.testname2\n" + "".join(
+                " {}.testname\n".format(i) for i in range(2, 10)
+            ) + "10.testname\n"
+        )
+
+    def test_color(self):
+        View(self.model[:1])
+        self.mock.assertEqual(
+            "\033[0m\033[33m\033[2m1-testname1\n"
+            "  \033[0m(testcomment)\n"
+            "\033[0m  \033[37m\033[1m1.testname2\n"
+        )
+
+    def test_chunks(self):
+        chunk = View.CHUNK
+        View.CHUNK = 2
+        try:
+            View(self.model, nocolor=True)
+        finally:
+            View.CHUNK = chunk
+        assert sys.stdout.getvalue().count("\n") == 12
+
+    def test_ids(self):
+        self.model[0].id = 7
+        View(self.model[:1], nocolor=True, ids=True)
+        self.mock.assertEqual(
+            "1-testname1 @7\n"
+            "  (testcomment)\n"
+            "  1.testname2 @None\n"
+        )
+
+    def test_start(self):
+        View(self.model[1:], nocolor=True, start=9)
+        assert sys.stdout.getvalue().startswith(" 9.testname\n10.testname\n")
+
+    def test_indexes(self):
+        self.model[0].id = 7
+        View(self.model[:2], nocolor=True, ids=True, indexes=["1", "2.10"])
+        self.mock.assertEqual(
+            "1-testname1 @7\n"
+            "  (testcomment)\n"
+            "2.10.testname @None\n"
+        )
+
+    def test_indexes_color(self):
+        View(self.model[:1], indexes=["3.1"])
+        self.mock.assertEqual(
+            "\033[0m\033[33m\033[2m3.1-testname1\n"
+            "    \033[0m(testcomment)\n"
+        )
 
 
 class TestParser_part(object):
@@ -150,6 +226,29 @@ class TestParserrock(object):
     def test_rm(self):
         self.assert_part("rm", "1.1")
 
+    def test_M_without_index(self):
+        self.do_part("M", "--parent", "1")
+        self.handler.assertLogged("move: Not enough arguments.")
+
+    def test_M(self):
+        self.assert_part("M", "1.1", "2")
+
+    def test_move(self):
+        self.assert_part("move", "1.1")
+
+    def test_s_without_query(self):
+        self.do_part("s", "--ids")
+        self.handler.assertLogged("search: Not enough arguments.")
+
+    def test_s(self):
+        self.assert_part("s", "buy", "milk")
+
+    def test_search(self):
+        self.assert_part("search", "milk")
+
+    def test_recursive(self):
+        self.assert_part("--recursive", "projects", "--view")
+
     def test_d_without_index(self):
         self.do_part("d")
         self.handler.assertLogged("done: Not enough arguments.")
@@ -176,6 +275,24 @@ class TestParserrock(object):
     def test_options(self):
         self.assert_part("options")
 
+    def test_b(self):
+        self.assert_part("b")
+
+    def test_batch(self):
+        self.assert_part("batch")
+
+    def test_x(self):
+        self.assert_part("x")
+
+    def test_export(self):
+        self.assert_part("export")
+
+    def test_i(self):
+        self.assert_part("i")
+
+    def test_import(self):
+        self.assert_part("import")
+
     def test_add_parent(self):
         # It deserves a separate test
         self.assert_part("a", "1.1")
@@ -346,6 +463,10 @@ class TestArg_getPattern(object):
         self.arg._getPattern("nema=.*", done=True)
         self.handler.assertLogged('Invalid field name: nema')
 
+    def test_passing_invalid_regexp_with_done(self):
+        self.arg._getPattern("name=[a-", done=True)
+        self.handler.assertLogged('Invalid regular expression: [a-')
+
     def test_empty_should_stay_empty(self):
         result = self.arg._getPattern(None)
         assert result is None
@@ -364,6 +485,27 @@ class TestArg(object):
         Arg(self.model)
         assert self.model.modify_val is True
 
+    def test_view_window(self):
+        self.mock.addArgs("v", "1", "--limit", "5", "--offset", "2")
+        Arg(self.model)
+        assert self.model.modify_kwargs == {
+            "filter": None, "index": "1", "offset": 2, "limit": 5,
+            "depth": None
+        }
+
+    def test_view_filter(self):
+        self.mock.addArgs("v", "1", "--filter", "name=a,2:b")
+        Arg(self.model)
+        assert self.model.modify_kwargs["filter"] == (
+            [(0, "a", True)], {2: [(None, "b", True)]}
+        )
+
+    def test_view_invalid_number(self):
+        handler = HandlerMock()
+        self.mock.addArgs("v", "1", "--depth", "0")
+        Arg(self.model)
+        handler.assertLogged("depth: Invalid number [0].")
+
     def test_modify(self):
         self.mock.addArgs("m", "-s", "sp", "-p", "-d", "dp", "-D", "Dp")
         Arg(self.model)
@@ -387,6 +529,75 @@ class TestArg(object):
         Arg(self.model)
         assert self.model.rm_val is True
 
+    def test_move(self):
+        self.mock.addArgs("M", "1.1", "@3", "--parent", "2")
+        Arg(self.model)
+        assert self.model.move_val == (["1.1", "@3"], "2")
+
+    def test_move_to_top_level(self):
+        self.mock.addArgs("M", "2.1", "--parent", "")
+        Arg(self.model)
+        assert self.model.move_val == (["2.1"], "")
+
+    def test_move_without_parent(self):
+        handler = HandlerMock()
+        self.mock.addArgs("M", "1.1")
+        Arg(self.model)
+        handler.assertLogged("move: Not enough arguments.")
+
+    def test_search(self):
+        self.mock.addArgs("s", "buy", "mil", "--no-color")
+        Arg(self.model)
+        assert self.model.search_val == "buy mil"
+        self.mock.assertEqual("1.2.found\n")
+
+    def recursive(self, *args):
+        root = tempfile.mkdtemp(prefix='td-projects.')
+        self.model.gpath = os.path.join(root, ".tdrc")
+        for directory, priority in [("a", 3), ("a/b", 1)]:
+            os.makedirs(os.path.join(root, directory))
+            model = Model()
+            model.setPath(os.path.join(root, directory, ".td"))
+            model.gpath = self.model.gpath
+            model.add("item " + directory, priority=priority)
+        os.makedirs(os.path.join(root, "bad"))
+        with open(os.path.join(root, "bad", ".td"), "w") as f:
+            f.write("{broken")
+        self.mock.addArgs("--recursive", root, "--no-color", *args)
+        try:
+            Arg(self.model)
+            return root
+        finally:
+            shutil.rmtree(root)
+
+    def test_recursive(self):
+        self.recursive("-j", "1")
+        self.mock.assertEqual(
+            "list   lowest  low  medium  high  highest  total\n"
+            "a         0/0  0/0     1/0   0/0      0/0    1/0\n"
+            "a/b       1/0  0/0     0/0   0/0      0/0    1/0\n"
+            "total     1/0  0/0     1/0   0/0      0/0    2/0\n"
+        )
+
+    def test_recursive_view(self):
+        self.recursive("--view")
+        self.mock.assertEqual("a:\n1.item a\na/b:\n1.item a/b\n")
+
+    def test_recursive_unreadable_list(self):
+        handler = HandlerMock()
+        root = self.recursive()
+        assert handler.message.startswith(
+            "recursive: Cannot read list at [{}]: ".format(
+                os.path.join(root, "bad")
+            )
+        )
+
+    def test_recursive_invalid_jobs(self):
+        handler = HandlerMock()
+        self.mock.addArgs("--recursive", "--jobs", "0")
+        Arg(self.model)
+        handler.assertLogged("jobs: Invalid number [0].")
+
     def test_done(self):
         self.mock.addArgs("d", "1.1")
         Arg(self.model)
@@ -402,6 +613,77 @@ class TestArg(object):
         Arg(self.model)
         assert self.model.options_val is True
 
+    def batch(self, lines, *args):
+        path = os.path.join("tests", "batch")
+        with open(path, "w") as f:
+            f.write(lines)
+        self.mock.addArgs("b", path, *args)
+        try:
+            Arg(self.model)
+        finally:
+            os.remove(path)
+
+    def test_batch(self):
+        self.batch('# comment\n\nd 1.1\n["r", "1.2"]\n')
+        assert self.model.done_val is True
+        assert self.model.rm_val is True
+        assert self.model.discard_val is False
+
+    def test_batch_uses_defaults(self):
+        self.batch('a 1 -n "test name"\n')
+        assert self.model.add_kwargs == {
+            "name": "test name", "priority": 3, "comment": "", "parent": "1"
+        }
+
+    def test_batch_without_name(self):
+        handler = HandlerMock()
+        self.batch("a 1 -p 2\n")
+        handler.assertLogged("batch: Line 1: Needs user input.")
+        assert self.model.add_val is False
+
+    def test_batch_invalid_line(self):
+        handler = HandlerMock()
+        self.batch('d 1\n"unterminated\n')
+        handler.assertLogged("batch: Line 2: No closing quotation.")
+        assert self.model.done_val is True
+
+    def test_batch_atomic(self):
+        handler = HandlerMock()
+        self.batch("d 1\ndang\n", "--atomic")
+        handler.assertLogged(
+            "batch: 1 command(s) failed, no changes were saved."
+        )
+        assert self.model.discard_val is True
+
+    def test_export(self):
+        self.mock.addArgs("x")
+        Arg(self.model)
+        self.mock.assertEqual("mock\n")
+
+    def test_export_to_file(self):
+        path = os.path.join("tests", "export")
+        self.mock.addArgs("x", path)
+        try:
+            Arg(self.model)
+            assert open(path).read() == "mock\n"
+        finally:
+            os.remove(path)
+
+    def test_import_from_file(self):
+        path = os.path.join("tests", "import")
+        with open(path, "w") as f:
+            f.write("lines\n")
+        self.mock.addArgs("i", path, "--replace")
+        try:
+            Arg(self.model)
+        finally:
+            os.remove(path)
+        assert self.model.import_val == ("lines\n", True)
+
+    def test_batch_not_atomic(self):
+        self.batch("d 1\ndang\n")
+        assert self.model.discard_val is False
+
     def test_options_sort(self):
         self.mock.addArgs("o", "-s")
         Arg(self.model)
@@ -422,6 +704,11 @@ class TestArg(object):
         Arg(self.model)
         assert self.model.options_val is True
 
+    def test_options_storage(self):
+        self.mock.addArgs("o", "--storage", "journal")
+        Arg(self.model)
+        assert self.model.storage_val == "journal"
+
     def test_getKwargs(self):
         arg = Arg.__new__(Arg)
         result = arg.getKwargs({"priority": 3}, {"comment": "test"}, GetMock())
@@ -431,3 +718,39 @@ class TestArg(object):
             "priority": 3,
             "parent": "mock"
         }
+
+    def test_getKwargs_does_not_prompt_when_all_given(self):
+        arg = Arg.__new__(Arg)
+        args = {"name": "n", "priority": 3, "comment": "c", "parent": "1"}
+        assert arg.getKwargs(args) == args
+
+
+class TestRun(object):
+    def setUp(self):
+        self.mock = StdoutMock()
+        self.mock.resetArgv()
+        self.mock.addArgs("-v")
+
+    def tearDown(self):
+        self.mock.undo()
+        os.environ.pop("TD_DURABILITY", None)
+        Model.durability = NOSYNC
+
+    def test_durability(self):
+        os.environ["TD_DURABILITY"] = DIRSYNC
+        run()
+        assert Model.durability == DIRSYNC
+
+    def test_unknown_durability(self):
+        os.environ["TD_DURABILITY"] = "sometimes"
+        run()
+        assert Model.durability == NOSYNC
+
+
+class TestImports(object):
+    def test_interactive_modules_are_not_imported(self):
+        code = "import sys, td; print(sys.modules.keys() & {}, end='')"
+        out = subprocess.check_output([
+            sys.executable, "-c", code.format({"readline", "sqlite3"})
+        ])
+        assert out == b"set()"
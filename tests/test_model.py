@@ -18,8 +18,22 @@
 
 import os
 import json
+import fcntl
+import marshal
+import random
+import multiprocessing
+from array import array
+from io import StringIO
 from tests.mocks import HandlerMock
 from td.main import Model
+from td.model import (
+    Item, compileSort, compileFilter,
+    InvalidImportError, InvalidMoveError, ConflictError
+)
+from td.storage import (
+    write, dump, NOSYNC, FSYNC, DIRSYNC, EXCLUSIVE,
+    JournalStorage, SQLiteStorage, UnknownStorageError
+)
 
 
 class ModelTest(object):
@@ -31,12 +45,24 @@ class ModelTest(object):
         self.tmppath = os.path.join(path, '.td~')
 
     def tearDown(self):
-        try:
-            os.remove(self.model.path)
-            os.remove(self.tmppath)
-            os.remove(self.model.gpath)
-        except OSError:
-            pass
+        for path in [
+            self.model.path, self.tmppath, self.model.gpath,
+            self.model.path + '.cache', self.model.path + '.lock',
+            self.model.path + '.index'
+        ]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def getNewModel(self):
+        model = Model()
+        model.setPath(self.model.path)
+        model.gpath = self.model.gpath
+        return model
+
+    def names(self, items):
+        return [(item.name, self.names(item.children)) for item in items]
 
 
 class TestBackup(ModelTest):
@@ -46,11 +72,34 @@ class TestBackup(ModelTest):
         assert os.path.exists(self.tmppath)
         assert json.loads(open(self.tmppath).read()) == {
             'items': [["testname1", 3, "", False, []]],
-            'refs': {},
-            'options': {}
+            'refs': {'ids': [1], 'next': 2},
+            'options': {},
+            'version': 1
         }
 
 
+class TestDevtodo(ModelTest):
+    def test_reads_comments_and_children(self):
+        todopath = os.path.join(os.path.dirname(self.model.path), '.todo')
+        open(todopath, 'w').write(
+            '<todo version="0.1.20">'
+            '<note priority="high" done="1">devtodo1'
+            '<comment>comment1</comment>'
+            '<note priority="medium">devtodo2</note>'
+            '</note>'
+            '</todo>'
+        )
+        try:
+            result = list(self.model)
+        finally:
+            os.remove(todopath)
+        assert result == [
+            ["devtodo1", 4, "comment1", True, [
+                ["devtodo2", 3, "", False, []]
+            ]]
+        ]
+
+
 class TestAdd(ModelTest):
     def test_add_top_level_item(self):
         self.model.add("testname")
@@ -83,6 +132,18 @@ class TestRemove(ModelTest):
         self.model.remove("1.1")
         handler.assertLogged('No item found at index [1.1].')
 
+    def test_remove_by_invalid_index(self):
+        handler = HandlerMock()
+        self.model.add("testname")
+        for index, message in [
+            ("@7", "@7"), ("@x", "@x"), ("", "")
+        ]:
+            self.model.remove(index)
+            handler.assertLogged(
+                'No item found at index [{}].'.format(message)
+            )
+        assert self.model == [["testname", 3, "", False, []]]
+
 
 class TestEdit(ModelTest):
     def setUp(self):
@@ -151,6 +212,95 @@ class TestEdit(ModelTest):
             ["testname2", 3, "", False, []]
         ]
 
+    def test_reparent_identical_item(self):
+        self.model.add("testname")
+        self.model.add("testname2")
+        self.model.edit("2", parent="3")
+        assert [item.id for item, _ in self.model._walk(self.model)] == [
+            1, 3, 2
+        ]
+
+    def test_reparent_into_itself(self):
+        self.model.add("testname2", parent="1")
+        for parent in ["1", "1.1", "@2"]:
+            try:
+                self.model.edit("1", name="testname0", parent=parent)
+            except InvalidMoveError:
+                pass
+            else:
+                assert False
+        assert self.model == [["testname", 3, "", False, [
+            ["testname2", 3, "", False, []]
+        ]]]
+
+
+class TestMove(ModelTest):
+    def setUp(self):
+        super().setUp()
+        self.model.add("testname1")
+        self.model.add("testname2")
+        self.model.add("testname3", parent="2")
+        self.model.add("testname4")
+
+    def test_move_only_top_level_item(self):
+        self.model.remove("3")
+        self.model.move(["2"], "1")
+        with self.model.session():
+            self.model.move(["1"], "")
+            self.model.add("testname5")
+        assert self.names(self.getNewModel()) == [
+            ("testname1", [("testname2", [("testname3", [])])]),
+            ("testname5", [])
+        ]
+
+    def test_move(self):
+        self.model.move(["3", "2.1"], "1")
+        assert self.names(self.model) == [
+            ("testname1", [("testname4", []), ("testname3", [])]),
+            ("testname2", [])
+        ]
+
+    def test_move_to_top_level(self):
+        self.model.move(["2.1", "1"])
+        assert self.names(self.model) == [
+            ("testname2", []), ("testname4", []),
+            ("testname3", []), ("testname1", [])
+        ]
+
+    def test_move_with_descendant(self):
+        self.model.move(["2", "2.1"], "3")
+        assert self.names(self.model) == [
+            ("testname1", []),
+            ("testname4", [("testname2", []), ("testname3", [])])
+        ]
+
+    def test_move_same_item_twice(self):
+        self.model.move(["@1", "1"], "2")
+        assert self.names(self.model)[0] == (
+            "testname2", [("testname3", []), ("testname1", [])]
+        )
+
+    def test_move_into_itself(self):
+        handler = HandlerMock()
+        self.model.move(["1", "2"], "2.1")
+        handler.assertLogged("Cannot move [2] into itself or its child [2.1].")
+        assert self.names(self.model)[0] == ("testname1", [])
+
+    def test_move_non_existing_item(self):
+        handler = HandlerMock()
+        self.model.move(["1", "5"], "2")
+        handler.assertLogged("No item found at index [5].")
+        assert self.names(self.model)[0] == ("testname1", [])
+
+    def test_move_keeps_id_index(self):
+        self.model.exists("@1")
+        self.model.move(["1"], "2.1")
+        assert self.model.get("@1")[0] == "@3"
+        assert self.model._ids() == dict(
+            (item.id, (item, parent))
+            for item, parent in self.model._walk(self.model.data)
+        )
+
 
 class TestExists(ModelTest):
     def test_existing_top_level_index(self):
@@ -183,6 +333,97 @@ class TestGet(ModelTest):
         assert self.model.get("1.1") == ["1", "testname2", 3, "", False, []]
 
 
+class TestSearch(ModelTest):
+    def setUp(self):
+        super().setUp()
+        self.ipath = self.model.path + '.index'
+        self.model.add("Buy milk", comment="Whole milk")
+        self.model.add("Shopping")
+        self.model.add("Buy bread", parent="2")
+        self.model.add("Milkshake", parent="2")
+
+    def found(self, query):
+        return [(i, item.name) for i, item in self.model.search(query)]
+
+    def stored(self):
+        with open(self.ipath, 'rb') as f:
+            key, postings = marshal.load(f)
+        assert key == [marshal.version, self.model._stat()[:2]]
+        return dict(
+            (word, set(array('q', ids))) for word, ids in postings.items()
+        )
+
+    def test_finds_by_name_and_comment(self):
+        assert self.found("shopping") == [("2", "Shopping")]
+        assert self.found("whole") == [("1", "Buy milk")]
+
+    def test_ignores_case_and_matches_prefixes(self):
+        assert self.found("WHOLE Milk") == [("1", "Buy milk")]
+        assert self.found("mil") == [("1", "Buy milk"), ("2.2", "Milkshake")]
+
+    def test_needs_all_words(self):
+        assert self.found("buy MIL") == [("1", "Buy milk")]
+        assert self.found("buy cheese") == []
+        assert self.found(" - ") == []
+
+    def test_stores_index(self):
+        self.found("buy")
+        postings = self.stored()
+        assert postings['buy'] == {1, 3}
+        postings['secret'] = {2}  # Not packed, but still readable
+        with open(self.ipath, 'wb') as f:
+            marshal.dump([[marshal.version, self.model._stat()[:2]],
+                          postings], f)
+        assert self.found("secret") == [("2", "Shopping")]
+
+    def test_ignores_stale_index(self):
+        self.found("buy")
+        document = json.loads(open(self.model.path).read())
+        document['items'][0][0] = "Sell honey"
+        with open(self.model.path, 'w') as f:
+            f.write(json.dumps(document))
+        assert self.found("honey") == [("1", "Sell honey")]
+        assert self.found("buy") == [("2.1", "Buy bread")]
+
+    def test_updates_stored_index(self):
+        self.found("buy")
+        self.model.add("Buy eggs", parent="2")
+        self.model.edit("1", name="Sell milk")
+        self.model.remove("2.1")
+        postings = self.stored()
+        assert postings['buy'] == {5}
+        assert 'bread' not in postings
+        assert self.found("buy") == [("2.2", "Buy eggs")]
+        assert self.found("sell") == [("1", "Sell milk")]
+
+    def test_import(self):
+        self.found("buy")
+        self.model.importItems(StringIO(
+            '{"index": "1", "name": "Buy tea"}\n'
+        ))
+        assert self.found("buy") == [("1", "Buy milk"), ("2.1", "Buy bread"),
+                                     ("3", "Buy tea")]
+        self.model.importItems(StringIO(
+            '{"index": "1", "name": "Buy coffee"}\n'
+        ), replace=True)
+        assert self.stored() == {'buy': {6}, 'coffee': {6}}
+
+    def test_follows_permanent_options(self):
+        self.found("buy")
+        self.model.setOptions(sort=([(0, True)], {}), purge=True)
+        self.model.edit("1.2", done=True)
+        assert self.found("buy") == [("2", "Buy milk")]
+        assert self.found("mil") == [("1.1", "Milkshake"), ("2", "Buy milk")]
+
+    def test_sqlite(self):
+        self.model.setStorage('sqlite')
+        assert self.found("buy") == [("1", "Buy milk"), ("2.1", "Buy bread")]
+        self.model.add("Buy eggs")
+        self.model.edit("@3", comment="Rye")
+        assert self.found("rye") == [("2.1", "Buy bread")]
+        assert self.stored()['eggs'] == {5}
+
+
 class ModifyTest(ModelTest):
     def setUp(self):
         super().setUp()
@@ -453,6 +694,177 @@ class TestModify(ModifyTest):
             ]]
         ]
 
+    def test_done_first_level_only(self):
+        self.addSecondLevel()
+        done = ([], {1: [(None, r'testname2', True)]})
+        result = self.model.modify(done=done)
+        assert result == [
+            ["testname1", 4, "", True, []],
+            ["testname2", 3, "", True, [
+                ["testname3", 2, "", False, []],
+                ["testname4", 3, "", False, []]
+            ]]
+        ]
+
+    def test_done_with_level_specified_as_string(self):
+        # JSON corner case
+        self.addSecondLevel()
+        done = ([], {"2": [(1, r'2', True)]})
+        result = self.model.modify(done=done)
+        assert result == [
+            ["testname1", 4, "", True, []],
+            ["testname2", 3, "", False, [
+                ["testname3", 2, "", True, []],
+                ["testname4", 3, "", False, []]
+            ]]
+        ]
+
+
+class TestModifyWindow(ModifyTest):
+    def test_limit(self):
+        self.addSecondLevel()
+        result = self.model.modify(limit=1)
+        assert result == [["testname1", 4, "", True, []]]
+
+    def test_offset(self):
+        self.addSecondLevel()
+        result = self.model.modify(offset=1)
+        assert result == [
+            ["testname2", 3, "", False, [
+                ["testname3", 2, "", False, []],
+                ["testname4", 3, "", False, []]
+            ]]
+        ]
+
+    def test_offset_and_limit_with_sort(self):
+        for i in range(20):
+            self.model.add("n{}".format(i), priority=i % 5 + 1)
+        sort = ([(1, True), (0, False)], {})
+        full = self.model.modify(sort=sort)
+        result = self.model.modify(sort=sort, offset=3, limit=7)
+        assert result == full[3:10]
+
+    def test_limit_with_purge(self):
+        result = self.model.modify(purge=True, limit=1)
+        assert result == [["testname2", 3, "", False, []]]
+
+    def test_depth(self):
+        self.addSecondLevel()
+        result = self.model.modify(depth=1)
+        assert result == [
+            ["testname1", 4, "", True, []],
+            ["testname2", 3, "", False, []]
+        ]
+
+    def test_index(self):
+        self.addSecondLevel()
+        self.addThirdLevel()
+        result = self.model.modify(index="2", depth=1)
+        assert result == [
+            ["testname3", 2, "", False, []],
+            ["testname4", 3, "", False, []]
+        ]
+
+    def test_index_uses_level_specific_sort(self):
+        self.addSecondLevel()
+        sort = ([], {2: [(0, True)]})
+        result = self.model.modify(sort=sort, index="2")
+        assert result == [
+            ["testname4", 3, "", False, []],
+            ["testname3", 2, "", False, []]
+        ]
+
+    def test_does_not_change_source_model(self):
+        self.addSecondLevel()
+        self.model.modify(depth=1, limit=1)
+        assert len(self.model.get("2")[5]) == 2
+
+
+class TestModifyFilter(ModifyTest):
+    def prune(self, items, match, level=1):
+        pruned = list()
+        for item in items:
+            children = self.prune(item.children, match, level + 1)
+            if children or match(item, level):
+                pruned.append(Item(
+                    item.name, item.priority, item.comment, item.done,
+                    children, item.id
+                ))
+        return pruned
+
+    def test_keeps_ancestors(self):
+        self.addSecondLevel()
+        self.addThirdLevel()
+        result = self.model.modify(filter=([(0, r'testname6', True)], {}))
+        assert result == [
+            ["testname2", 3, "", False, [
+                ["testname3", 2, "", False, [
+                    ["testname6", 2, "", False, []]
+                ]]
+            ]]
+        ]
+
+    def test_drops_children_not_matching(self):
+        self.addSecondLevel()
+        result = self.model.modify(filter=([(0, r'testname2', True)], {}))
+        assert result == [["testname2", 3, "", False, []]]
+
+    def test_any_field(self):
+        self.addComments()
+        result = self.model.modify(filter=([(None, r'.*comment1', True)], {}))
+        assert result == [["testname1", 4, "testcomment1", True, []]]
+
+    def test_level(self):
+        self.addMore()
+        result = self.model.modify(filter=([], {2: [(1, r'[12]', True)]}))
+        assert result == [
+            ["testname2", 3, "", False, [
+                ["testname3", 2, "", False, []],
+                ["testname5", 1, "", False, []],
+                ["testname6", 1, "", False, []]
+            ]]
+        ]
+
+    def test_nothing_matches(self):
+        self.addSecondLevel()
+        assert self.model.modify(filter=([(0, r'x', True)], {})) == []
+
+    def test_depth(self):
+        self.addSecondLevel()
+        self.addThirdLevel()
+        filter = ([(0, r'testname6', True)], {})
+        assert self.model.modify(filter=filter, depth=2) == [
+            ["testname2", 3, "", False, [["testname3", 2, "", False, []]]]
+        ]
+
+    def test_with_other_modifiers(self):
+        self.addMore()
+        self.addThirdLevel()
+        self.model.add("testname7", parent="2.3")
+        rnd = random.Random(0)
+        for _ in range(20):
+            self.model.add("n{}".format(rnd.randint(0, 99)), parent=rnd.choice(
+                ["", "1", "2", "2.1", "2.2", "2.1.1"]
+            ), priority=rnd.randint(1, 5))
+        sort = ([(1, True), (0, False)], {2: [(0, True)]})
+        done = ([(0, r'n1', True)], {})
+        for filter in [
+            ([(0, r'n[12]', True)], {}), ([(1, r'5', True)], {3: []}),
+            ([], {2: [(None, r'testname', True)]}),
+            ([(0, r'n\d$', True)], {1: [(0, r'testname3', True)]})
+        ]:
+            match = compileFilter(filter)
+            for purge in [False, True]:
+                full = self.model.modify(sort=sort, purge=purge, done=done)
+                result = self.model.modify(
+                    sort=sort, purge=purge, done=done, filter=filter
+                )
+                assert result == self.prune(full, match)
+                assert self.model.modify(
+                    sort=sort, purge=purge, done=done, filter=filter,
+                    offset=1, limit=2
+                ) == result[1:3]
+
 
 class TestModifyInPlace(ModifyTest):
     def test_if_changes_get_propagated_to_source_model(self):
@@ -543,3 +955,912 @@ class TestOptions(ModifyTest):
                 ["testname4", 3, "", False, []]
             ]]
         ]
+
+
+class TestSession(ModelTest):
+    def setUp(self):
+        super().setUp()
+        self.model.add("testname")
+
+    def test_loads_only_once(self):
+        with self.model.session():
+            assert self.model.exists("1")
+            os.remove(self.model.path)
+            assert self.model.get("1") == ["", "testname", 3, "", False, []]
+
+    def test_saves_only_at_the_end(self):
+        with self.model.session():
+            self.model.add("testname2")
+            self.model.edit("1", done=True)
+            assert json.loads(open(self.model.path).read())['items'] == [
+                ["testname", 3, "", False, []]
+            ]
+        assert json.loads(open(self.model.path).read())['items'] == [
+            ["testname", 3, "", True, []],
+            ["testname2", 3, "", False, []]
+        ]
+
+    def test_does_not_save_without_changes(self):
+        mtime = os.stat(self.model.path).st_mtime_ns
+        with self.model.session():
+            self.model.exists("1")
+        assert os.stat(self.model.path).st_mtime_ns == mtime
+
+    def test_does_not_save_on_error(self):
+        try:
+            with self.model.session():
+                self.model.add("testname2")
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        assert json.loads(open(self.model.path).read())['items'] == [
+            ["testname", 3, "", False, []]
+        ]
+
+    def test_reloads_after_session_ends(self):
+        with self.model.session():
+            self.model.exists("1")
+        os.remove(self.model.path)
+        assert not self.model.exists("1")
+
+
+class TestDiscard(ModelTest):
+    def test_drops_session_changes(self):
+        self.model.add("testname1")
+        with self.model.session():
+            self.model.add("testname2")
+            self.model.discard()
+            assert len(list(self.model)) == 1
+        assert list(self.model) == [["testname1", 3, "", False, []]]
+
+
+class TestExportImport(ModifyTest):
+    def export(self):
+        stream = StringIO()
+        self.model.exportItems(stream)
+        return stream.getvalue()
+
+    def test_export(self):
+        self.addSecondLevel()
+        lines = [json.loads(line) for line in self.export().splitlines()]
+        assert [line['index'] for line in lines] == ["1", "2", "2.1", "2.2"]
+        assert lines[2] == {
+            'index': "2.1", 'id': 3, 'name': "testname3", 'priority': 2,
+            'comment': "", 'done': False
+        }
+
+    def test_import_appends(self):
+        self.addSecondLevel()
+        exported = self.export()
+        assert self.model.importItems(StringIO(exported)) == 4
+        result = list(self.model)
+        assert result[:2] == result[2:]
+
+    def test_import_replaces(self):
+        self.addSecondLevel()
+        exported = self.export()
+        self.model.remove("1")
+        self.model.importItems(StringIO(exported), replace=True)
+        assert len(list(self.model)) == 2
+        assert self.model.get("2.2")[1] == "testname4"
+
+    def test_import_defaults_and_empty_lines(self):
+        self.model.importItems(StringIO('\n{"index": "1", "name": "n"}\n'))
+        assert list(self.model)[2] == ["n", 3, "", False, []]
+
+    def test_invalid_import_changes_nothing(self):
+        stream = StringIO(
+            '{"index": "1", "name": "n"}\n{"index": "2.1", "name": "m"}\n'
+        )
+        try:
+            self.model.importItems(stream)
+        except InvalidImportError as e:
+            assert str(e) == "Invalid item at line [2]."
+        else:
+            assert False
+        assert len(list(self.model)) == 2
+
+    def test_import_is_journaled(self):
+        self.model.setStorage('journal')
+        try:
+            self.model.importItems(StringIO('{"index": "1", "name": "n"}'))
+            model = Model()
+            model.setPath(self.model.path)
+            model.gpath = self.model.gpath
+            assert list(model)[2] == ["n", 3, "", False, []]
+        finally:
+            os.remove(self.model.path + '.journal')
+
+
+class TestIds(ModifyTest):
+    def setUp(self):
+        super().setUp()
+        self.addSecondLevel()
+
+    def ids(self, model):
+        return [item.id for item, _ in model._walk(list(model))]
+
+    def test_ids_are_stored_in_refs(self):
+        refs = json.loads(open(self.model.path).read())['refs']
+        assert refs == {'ids': [1, 2, 3, 4], 'next': 5}
+
+    def test_ids_survive_sorting(self):
+        self.model.modifyInPlace(sort=([(0, True)], {}))
+        model = self.getNewModel()
+        assert self.ids(model) == [2, 4, 3, 1]
+        assert model.get("@3")[1:3] == ["testname3", 2]
+
+    def test_ids_are_not_reused(self):
+        self.model.remove("@4")
+        self.model.add("testname5")
+        assert self.ids(self.getNewModel()) == [1, 2, 3, 5]
+
+    def test_ids_are_given_to_old_files(self):
+        write(self.model.path, json.dumps({
+            'items': [["testname1", 3, "", False, []]],
+            'refs': {}, 'options': {}
+        }))
+        assert self.ids(self.getNewModel()) == [1]
+
+    def test_address_by_id(self):
+        assert self.model.exists("@3")
+        assert not self.model.exists("@7")
+        assert self.model.exists("@2.2")
+        assert self.model.get("@2.2") == [
+            "@2.2"[:2], "testname4", 3, "", False, []
+        ]
+        assert self.model.get("@3")[0] == "@2"
+        assert self.model.get("@1")[0] == ""
+
+    def test_add_top_level_in_session_with_index(self):
+        with self.model.session():
+            self.model.edit("@1", done=True)
+            self.model.add("testname5")
+            assert self.model.exists("@5")
+            self.model.add("testname6", parent="@5")
+            self.model.move(["2"], "@6")
+        assert self.names(self.getNewModel()) == [
+            ("testname1", []), ("testname5", [("testname6", [
+                ("testname2", [("testname3", []), ("testname4", [])])
+            ])])
+        ]
+
+    def test_edit_by_id(self):
+        self.model.edit("@4", name="testname5", parent="@1")
+        assert list(self.model) == [
+            ["testname1", 4, "", True, [["testname5", 3, "", False, []]]],
+            ["testname2", 3, "", False, [["testname3", 2, "", False, []]]]
+        ]
+        assert self.model.get("@4")[0] == "@1"
+
+    def test_edit_to_same_parent_keeps_position(self):
+        self.model.edit("2.1", parent="@2")
+        assert self.model.get("2.1")[1] == "testname3"
+
+    def test_remove_by_id(self):
+        self.model.remove("@3")
+        assert list(self.model)[1] == [
+            "testname2", 3, "", False, [["testname4", 3, "", False, []]]
+        ]
+
+    def test_add_to_id(self):
+        self.model.add("testname5", parent="@1")
+        assert self.model.get("@5")[0] == "@1"
+
+    def test_modify_by_id_uses_its_level(self):
+        sort = ([], {2: [(0, True)]})
+        result = self.model.modify(sort=sort, index="@2")
+        assert [v.id for v in result] == [4, 3]
+
+    def test_journal_keeps_ids(self):
+        self.model.setStorage('journal')
+        try:
+            self.model.remove("@1")
+            self.model.add("testname5", parent="@2")
+            assert self.ids(self.getNewModel()) == [2, 3, 4, 5]
+        finally:
+            os.remove(self.model.path + '.journal')
+
+    def test_sqlite_keeps_ids(self):
+        self.model.setStorage('sqlite')
+        self.model.remove("@1")
+        self.model.add("testname5", parent="@2")
+        self.model.edit("@3", parent="@5")
+        model = self.getNewModel()
+        assert self.ids(model) == [2, 4, 5, 3]
+        assert model.exists("@5.1")
+        model.setStorage('json')
+        assert self.ids(self.getNewModel()) == [2, 4, 5, 3]
+
+
+class TestLazyModify(ModelTest):
+    def setUp(self):
+        super().setUp()
+        self.model.add("testname2")
+        self.model.add("testname1")
+        self.calls = 0
+        modifyInternal = self.model._modifyInternal
+
+        def _modifyInternal(**kwargs):
+            self.calls += 1
+            return modifyInternal(**kwargs)
+        self.model._modifyInternal = _modifyInternal
+
+    def test_skip_without_options(self):
+        assert self.model.exists("2")
+        assert self.calls == 0
+
+    def test_skip_until_needed(self):
+        self.model.setOptions(sort=([(0, False)], {}))
+        self.calls = 0
+        with self.model.session():
+            self.model.setOptions(glob=True, purge=False)
+            assert self.calls == 0
+            assert self.model.get("1")[1] == "testname1"
+            assert self.calls == 1
+
+    def test_skip_when_stored_modified(self):
+        self.model.setOptions(sort=([(0, False)], {}))
+        self.model.add("testname0")
+        self.calls = 0
+        assert self.model.get("1")[1] == "testname0"
+        assert self.calls == 0
+        self.model.setOptions(sort=([(0, True)], {}))
+        assert self.model.get("1")[1] == "testname2"
+        assert self.calls == 1
+
+    def test_memoized(self):
+        sort = ([(0, False)], {})
+        with self.model.session():
+            result = self.model.modify(sort=sort)
+            assert self.model.modify(sort=sort) is result
+            assert self.calls == 1
+            self.model.add("testname3")
+            assert self.model.modify(sort=sort)[2].name == "testname3"
+            assert self.calls == 2
+
+    def test_without_modifiers(self):
+        with self.model.session():
+            assert self.model.modify() is self.model.data
+            assert self.calls == 0
+
+
+class TestIncrementalModify(ModifyTest):
+    def setUp(self):
+        super().setUp()
+        self.addMore()
+        self.model.setOptions(sort=([(1, True), (0, False)], {
+            2: [(0, True)]
+        }), done=([(0, "testname5", True)], {}))
+
+    def assertModified(self):
+        assert Item.toJSON(self.model.data) == Item.toJSON(
+            self.model._modifyInternal(**self.model._permanent)
+        )
+
+    def test_add(self):
+        with self.model.session():
+            self.model.add("testname4", priority=5)
+            self.model.add("testname7", priority=4, parent="3")
+            self.model.add("testname5")
+            self.assertModified()
+            assert self.names(self.model)[2:] == [
+                ("testname3", [("testname7", [])]),
+                ("testname4", []), ("testname5", [])
+            ]
+            assert self.model.get("5")[1:] == [
+                "testname5", 3, "", True, []
+            ]
+
+    def test_edit(self):
+        with self.model.session():
+            self.model.edit("2", priority=5)
+            self.model.edit("2.1", name="testname0")
+            self.assertModified()
+            assert self.names(self.model)[1] == ("testname2", [
+                ("testname5", []), ("testname4", []), ("testname3", []),
+                ("testname0", [])
+            ])
+
+    def test_edit_keeps_position_among_equal_items(self):
+        with self.model.session():
+            self.model.add("testname2")
+            self.model.edit("3", comment="testcomment")
+            assert self.model.get("3")[3] == "testcomment"
+            self.assertModified()
+
+    def test_move_between_levels(self):
+        with self.model.session():
+            self.model.move(["1"], "2.1")
+            self.model.edit("2", parent="1.1")
+            self.assertModified()
+            assert self.names(self.model)[0][1][0] == ("testname6", [
+                ("testname1", []), ("testname3", [])
+            ])
+            self.model.move(["1.1.1"])
+            self.assertModified()
+            self.model.move(["2"], "1")
+            self.assertModified()
+            assert self.names(self.model)[0][1][0][1][:2] == [
+                ("testname3", []), ("testname4", [])
+            ]
+
+    def test_purge(self):
+        self.model.setOptions(purge=True)
+        with self.model.session():
+            self.model.add("testname5", parent="1")
+            self.model.edit("1", done=True)
+            self.assertModified()
+            assert self.names(self.model) == [("testname3", [])]
+
+    def purgeMarked(self, engine):
+        self.model.setStorage(engine)
+        self.model.add("testname7", comment="testcomment")
+        self.model.setOptions(
+            purge=True, done=([(2, "testcomment", True)], {})
+        )
+        self.model.add("testname8")
+        self.model.add("testname9", comment="testcomment")
+        for model in [self.model, self.getNewModel()]:
+            names = [name for name, _ in self.names(model)]
+            assert "testname8" in names
+            assert "testname7" not in names
+            assert "testname9" not in names
+
+    def test_purge_marked_json(self):
+        self.purgeMarked('json')
+
+    def test_purge_marked_journal(self):
+        try:
+            self.purgeMarked('journal')
+        finally:
+            os.remove(self.model.path + '.journal')
+
+    def test_stored_modified(self):
+        self.model.add("testname7", priority=5)
+        model = Model()
+        model.setPath(self.model.path)
+        model.gpath = self.model.gpath
+        assert list(model) == list(self.model)
+        assert model.refs['derived'] == model._permanentKey()
+        assert not model._operations
+
+
+class TestWrite(ModelTest):
+    def test_dump(self):
+        for count in [0, 1, 4, 5]:
+            document = {
+                'items': [
+                    ["testname{}".format(i), 3, "", False, [
+                        ["testname", 2, "testcomment", True, []]
+                    ]] for i in range(count)
+                ],
+                'refs': {'next': 1}, 'options': {}, 'version': 2
+            }
+            stream = StringIO()
+            dump(document, stream, chunk=2)
+            assert json.loads(stream.getvalue()) == document
+
+    def test_backup_is_not_modified_by_save(self):
+        self.model.add("testname1")
+        self.model.add("testname2")
+        backup = os.stat(self.tmppath)
+        self.model.add("testname3")
+        assert os.stat(self.tmppath).st_ino != backup.st_ino
+        assert len(json.loads(open(self.tmppath).read())['items']) == 2
+
+    def test_keeps_file_mode(self):
+        self.model.add("testname1")
+        os.chmod(self.model.path, 0o640)
+        self.model.add("testname2")
+        assert os.stat(self.model.path).st_mode & 0o777 == 0o640
+
+    def test_does_not_leave_temporary_files(self):
+        for durability in [NOSYNC, FSYNC, DIRSYNC]:
+            self.model.durability = durability
+            self.model.add("testname")
+        dirname = os.path.dirname(self.model.path)
+        assert not [
+            f for f in os.listdir(dirname)
+            if f.startswith('.td.') and f not in ['.td.cache', '.td.lock']
+            or f.startswith('.td.cache.')
+        ]
+
+    def test_failed_write_keeps_old_contents(self):
+        self.model.add("testname1")
+        try:
+            write(self.model.path, object())
+        except TypeError:
+            pass
+        else:
+            assert False
+        assert json.loads(open(self.model.path).read())['items'] == [
+            ["testname1", 3, "", False, []]
+        ]
+
+
+class TestDirty(ModelTest):
+    def setUp(self):
+        super().setUp()
+        self.model.add("testname")
+
+    def test_does_not_write_global_options_on_add(self):
+        self.model.add("testname2")
+        assert not os.path.exists(self.model.gpath)
+
+    def test_writes_global_options_when_changed(self):
+        self.model.setOptions(glob=True, purge=True)
+        assert json.loads(open(self.model.gpath).read()) == {'purge': True}
+
+    def test_does_not_write_unchanged_global_options(self):
+        self.model.setOptions(glob=True, purge=True)
+        mtime = os.stat(self.model.gpath).st_mtime_ns
+        self.model.setOptions(glob=True, purge=True)
+        assert os.stat(self.model.gpath).st_mtime_ns == mtime
+
+    def test_does_not_write_local_file_on_global_options(self):
+        mtime = os.stat(self.model.path).st_mtime_ns
+        self.model.setOptions(glob=True, purge=True)
+        assert os.stat(self.model.path).st_mtime_ns == mtime
+
+    def test_does_not_write_local_file_on_failed_remove(self):
+        mtime = os.stat(self.model.path).st_mtime_ns
+        self.model.remove("2")
+        assert os.stat(self.model.path).st_mtime_ns == mtime
+
+    def test_does_not_write_local_file_on_unchanged_edit(self):
+        self.model.add("testname2", parent="1")
+        mtime = os.stat(self.model.path).st_mtime_ns
+        self.model.edit("1", name="testname", priority=3, done=False)
+        self.model.edit("1.1", comment="", parent="1")
+        assert os.stat(self.model.path).st_mtime_ns == mtime
+        self.model.edit("1.1", comment="testcomment")
+        assert json.loads(open(self.model.path).read())['items'] == [
+            ["testname", 3, "", False, [
+                ["testname2", 3, "testcomment", False, []]
+            ]]
+        ]
+
+
+class TestJournal(ModelTest):
+    def setUp(self):
+        super().setUp()
+        self.jpath = self.model.path + '.journal'
+        self.model.add("testname1")
+        self.model.setStorage('journal')
+
+    def tearDown(self):
+        super().tearDown()
+        try:
+            os.remove(self.jpath)
+        except OSError:
+            pass
+
+    def test_appends_changes_to_journal(self):
+        snapshot = open(self.model.path).read()
+        self.model.add("testname2", priority=4)
+        self.model.edit("1", done=True)
+        self.model.remove("2")
+        assert open(self.model.path).read() == snapshot
+        assert len(open(self.jpath).read().splitlines()) == 4
+
+    def test_replays_journal(self):
+        self.model.add("testname2", priority=4)
+        self.model.add("testname3", parent="2")
+        self.model.edit("2.1", parent=-1)
+        self.model.remove("1")
+        self.model.setOptions(purge=True)
+        assert list(self.getNewModel()) == [
+            ["testname2", 4, "", False, []],
+            ["testname3", 3, "", False, []]
+        ]
+        model = self.getNewModel()
+        list(model)
+        assert model.options == {'purge': True}
+
+    def test_replays_permanent_options(self):
+        self.model.setOptions(sort=([(0, True)], {}))
+        self.model.add("testname2")
+        self.model.add("testname0")
+        assert list(self.getNewModel()) == [
+            ["testname2", 3, "", False, []],
+            ["testname1", 3, "", False, []],
+            ["testname0", 3, "", False, []]
+        ]
+
+    def test_replays_moves_with_permanent_options(self):
+        self.model.add("testname2")
+        self.model.add("testname3")
+        self.model.setOptions(sort=([(0, True)], {}))
+        self.model.move(["@1"], "")
+        self.model.edit("@2", name="testname0")
+        assert self.names(self.getNewModel()) == [
+            ("testname3", []), ("testname1", []), ("testname0", [])
+        ]
+
+    def test_compacts_past_threshold(self):
+        self.model.add("testname2")
+        threshold = JournalStorage.threshold
+        JournalStorage.threshold = 0
+        try:
+            self.model.add("testname3")
+        finally:
+            JournalStorage.threshold = threshold
+        assert len(open(self.jpath).read().splitlines()) == 1
+        assert json.loads(open(self.model.path).read())['items'] == [
+            ["testname1", 3, "", False, []],
+            ["testname2", 3, "", False, []],
+            ["testname3", 3, "", False, []]
+        ]
+
+    def test_ignores_compacted_journal(self):
+        self.model.add("testname2")
+        journal = open(self.jpath).read()
+        self.model.storage.compact(self.model._document())
+        open(self.jpath, 'w').write(journal)
+        assert len(list(self.getNewModel())) == 2
+
+    def test_ignores_partially_written_operation(self):
+        self.model.add("testname2")
+        open(self.jpath, 'a').write('["add", ["testna')
+        assert len(list(self.getNewModel())) == 2
+
+    def test_back_to_json(self):
+        self.model.add("testname2")
+        self.model.setStorage('json')
+        assert not os.path.exists(self.jpath)
+        assert len(json.loads(open(self.model.path).read())['items']) == 2
+
+    def test_unknown_engine(self):
+        try:
+            self.model.setStorage('nosuchengine')
+        except UnknownStorageError:
+            pass
+        else:
+            assert False
+
+
+class TestSQLite(ModelTest):
+    def setUp(self):
+        super().setUp()
+        self.model.add("testname1")
+        self.model.add("testname2", parent="1")
+        self.model.setStorage('sqlite')
+
+    def test_migrates_from_json(self):
+        assert SQLiteStorage.detect(self.model.path)
+        assert json.loads(open(self.tmppath).read())['items'] == [
+            ["testname1", 3, "", False, [["testname2", 3, "", False, []]]]
+        ]
+        assert list(self.getNewModel()) == [
+            ["testname1", 3, "", False, [["testname2", 3, "", False, []]]]
+        ]
+
+    def test_migrates_from_devtodo(self):
+        os.remove(self.model.path)
+        todopath = os.path.join(os.path.dirname(self.model.path), '.todo')
+        open(todopath, 'w').write(
+            '<todo version="0.1.20">'
+            '<note priority="high" done="1">devtodo1</note>'
+            '<note priority="low">devtodo2</note>'
+            '</todo>'
+        )
+        try:
+            self.model.setStorage('sqlite')
+        finally:
+            os.remove(todopath)
+        assert list(self.getNewModel()) == [
+            ["devtodo1", 4, "", True, []],
+            ["devtodo2", 2, "", False, []]
+        ]
+
+    def test_queries_without_reading_items(self):
+        with self.model.session():
+            assert self.model.exists("1.1")
+            assert not self.model.exists("1.2")
+            assert self.model.get("1.1") == [
+                "1", "testname2", 3, "", False, []
+            ]
+            self.model.edit("1.1", done=True)
+            assert self.model._raw is not None
+
+    def test_changes(self):
+        self.model.add("testname3", priority=5, comment="testcomment")
+        self.model.add("testname4", parent="2")
+        self.model.edit("1", name="testname0", done=True)
+        self.model.edit("2.1", parent="1.1")
+        self.model.remove("2")
+        self.model.setOptions(purge=False)
+        model = self.getNewModel()
+        assert list(model) == [
+            ["testname0", 3, "", True, [["testname2", 3, "", False, [
+                ["testname4", 3, "", False, []]
+            ]]]]
+        ]
+        assert model.options == {'purge': False}
+
+    def test_changes_after_reading_items(self):
+        with self.model.session():
+            self.model.edit("1.1", done=True)
+            assert list(self.model) == [
+                ["testname1", 3, "", False, [["testname2", 3, "", True, []]]]
+            ]
+            self.model.add("testname3")
+        assert list(self.getNewModel()) == [
+            ["testname1", 3, "", False, [["testname2", 3, "", True, []]]],
+            ["testname3", 3, "", False, []]
+        ]
+
+    def test_permanent_options(self):
+        self.model.setOptions(sort=([(0, True)], {}))
+        self.model.add("testname3")
+        assert list(self.getNewModel()) == [
+            ["testname3", 3, "", False, []],
+            ["testname1", 3, "", False, [["testname2", 3, "", False, []]]]
+        ]
+
+    def test_remove_non_existing_item(self):
+        handler = HandlerMock()
+        self.model.remove("1.2")
+        handler.assertLogged('No item found at index [1.2].')
+
+    def test_move(self):
+        self.model.add("testname3")
+        self.model.add("testname4", parent="2")
+        self.model.move(["1.1", "2", "2.1"], "1")
+        self.model.move(["1.1"])
+        assert list(self.getNewModel()) == [
+            ["testname1", 3, "", False, [
+                ["testname3", 3, "", False, []],
+                ["testname4", 3, "", False, []]
+            ]],
+            ["testname2", 3, "", False, []]
+        ]
+
+    def test_move_into_itself(self):
+        handler = HandlerMock()
+        self.model.move(["1"], "1.1")
+        handler.assertLogged('Cannot move [1] into itself or its child [1.1].')
+        try:
+            self.model.edit("1", parent="1")
+        except InvalidMoveError:
+            pass
+        else:
+            assert False
+        assert list(self.getNewModel()) == [
+            ["testname1", 3, "", False, [["testname2", 3, "", False, []]]]
+        ]
+
+    def test_back_to_json(self):
+        self.model.setStorage('json')
+        assert json.loads(open(self.model.path).read())['items'] == [
+            ["testname1", 3, "", False, [["testname2", 3, "", False, []]]]
+        ]
+
+
+def addMany(path, count):
+    model = Model()
+    model.setPath(path)
+    model.gpath = path + 'rc'
+    model.durability = NOSYNC
+    for i in range(count):
+        model.add("testname")
+
+
+class TestLocking(ModelTest):
+    def setUp(self):
+        super().setUp()
+        self.model.add("testname1")
+        self.model.add("testname2")
+
+    def tearDown(self):
+        super().tearDown()
+        try:
+            os.remove(self.model.path + '.journal')
+        except OSError:
+            pass
+
+    def concurrent(self, engine):
+        self.model.setStorage(engine)
+        other = self.getNewModel()
+        with self.model.session():
+            self.model.add("testname3")
+            self.model.edit("@2", name="testname0")
+            other.add("testname4", parent="2")
+            other.remove("1")
+        assert self.names(self.getNewModel()) == [
+            ("testname0", [("testname4", [])]), ("testname3", [])
+        ]
+
+    def test_concurrent_json(self):
+        self.concurrent('json')
+
+    def test_concurrent_journal(self):
+        self.concurrent('journal')
+
+    def test_concurrent_sqlite(self):
+        self.concurrent('sqlite')
+
+    def positions(self, engine):
+        self.model.add("testname3")
+        self.model.setStorage(engine)
+        other = self.getNewModel()
+        with self.model.session():
+            self.model.remove("2")
+            self.model.edit("2", name="testname0")
+            self.model.add("testname4", parent="2")
+            other.remove("1")
+        assert self.names(self.getNewModel()) == [
+            ("testname0", [("testname4", [])])
+        ]
+
+    def test_positions_json(self):
+        self.positions('json')
+
+    def test_positions_journal(self):
+        self.positions('journal')
+
+    def test_positions_sqlite(self):
+        self.positions('sqlite')
+
+    def test_position_of_new_item(self):
+        other = self.getNewModel()
+        try:
+            with self.model.session():
+                self.model.add("testname3")
+                self.model.edit("3", done=True)
+                other.add("testname4")
+        except ConflictError as e:
+            assert str(e) == (
+                "List was changed by another td, nothing was saved:"
+                " Cannot tell which item [3] is anymore, as it is not"
+                " referred to by id."
+            )
+        else:
+            assert False
+        assert self.names(self.getNewModel()) == [
+            ("testname1", []), ("testname2", []), ("testname4", [])
+        ]
+
+    def test_version(self):
+        assert json.loads(open(self.model.path).read())['version'] == 2
+        self.model.add("testname3")
+        assert json.loads(open(self.model.path).read())['version'] == 3
+
+    def test_conflict(self):
+        other = self.getNewModel()
+        try:
+            with self.model.session():
+                self.model.edit("2", done=True)
+                other.remove("2")
+        except ConflictError as e:
+            assert str(e) == (
+                "List was changed by another td, nothing was saved:"
+                " No item found at index [@2]."
+            )
+        else:
+            assert False
+        assert self.names(self.getNewModel()) == [("testname1", [])]
+
+    def test_exclusive(self):
+        self.model.locking = EXCLUSIVE
+        fd = os.open(self.model.path + '.lock', os.O_RDWR)
+        try:
+            with self.model.session():
+                list(self.model)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    pass
+                else:
+                    assert False
+                self.model.add("testname3")
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        finally:
+            os.close(fd)
+        assert self.names(self.getNewModel())[-1] == ("testname3", [])
+
+    def test_set_storage_writes_changes_once(self):
+        with self.model.session():
+            self.model.add("testname3")
+            self.model.setStorage('sqlite')
+        assert self.names(self.getNewModel()) == [
+            ("testname1", []), ("testname2", []), ("testname3", [])
+        ]
+
+    def test_many_processes(self):
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=addMany, args=(self.model.path, 25))
+            for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        model = self.getNewModel()
+        assert len(list(model)) == 102
+        assert sorted(item.id for item, _ in model._walk(model.data)) == list(
+            range(1, 103)
+        )
+
+
+class TestCache(ModelTest):
+    def setUp(self):
+        super().setUp()
+        self.cpath = self.model.path + '.cache'
+        self.model.add("testname1")
+
+    def test_writes_cache_on_save(self):
+        key, document = marshal.load(open(self.cpath, 'rb'))
+        assert document == json.loads(open(self.model.path).read())
+
+    def test_reads_from_cache(self):
+        key, document = marshal.load(open(self.cpath, 'rb'))
+        document['items'][0][0] = "cached"
+        marshal.dump((key, document), open(self.cpath, 'wb'))
+        assert list(self.getNewModel()) == [["cached", 3, "", False, []]]
+
+    def test_ignores_stale_cache(self):
+        open(self.model.path, 'w').write(json.dumps({
+            'items': [["external", 3, "", False, []]],
+            'refs': {}, 'options': {}
+        }))
+        assert list(self.getNewModel()) == [["external", 3, "", False, []]]
+        key, document = marshal.load(open(self.cpath, 'rb'))
+        assert document['items'] == [["external", 3, "", False, []]]
+
+    def test_ignores_broken_cache(self):
+        open(self.cpath, 'wb').write(b'broken')
+        assert list(self.getNewModel()) == [["testname1", 3, "", False, []]]
+
+    def test_normalizes_options(self):
+        self.model.setOptions(sort=([(0, True)], {1: [(1, False)]}))
+        key, document = marshal.load(open(self.cpath, 'rb'))
+        assert document['options'] == json.loads(
+            open(self.model.path).read()
+        )['options']
+
+
+class TestItem(object):
+    def test_behaves_like_list(self):
+        item = Item("testname", 3, "", False, [])
+        assert item == ["testname", 3, "", False, []]
+        assert ["testname", 3, "", False, []] == item
+        assert item != ["testname", 3, "", True, []]
+        assert item[1] == 3
+        assert item[:4] == ["testname", 3, "", False]
+        assert list(item) == ["testname", 3, "", False, []]
+
+    def test_json_round_trip(self):
+        items = [
+            ["testname1", 3, "c", True, [["testname2", 1, "", False, []]]]
+        ]
+        assert Item.toJSON(Item.fromJSON(items)) == items
+        assert isinstance(Item.fromJSON(items)[0].children[0], Item)
+
+
+class TestCompileSort(object):
+    def sequential(self, items, rules):
+        for index, reverse in rules:
+            items = sorted(items, key=lambda e: e[index], reverse=reverse)
+        return items
+
+    def test_same_as_sequential_sorts(self):
+        rnd = random.Random(0)
+        items = [Item(
+            rnd.choice("abc"), rnd.randint(1, 5), rnd.choice("xy"),
+            rnd.choice([True, False]), []
+        ) for _ in range(200)]
+        for rules in [
+            [(0, False)], [(1, True)], [(0, True), (1, True)],
+            [(0, True), (1, False)], [(2, False), (3, True), (1, False)]
+        ]:
+            (key, reverse), _ = compileSort((rules, {}))
+            assert sorted(items, key=key, reverse=reverse) == \
+                self.sequential(items, rules)
+
+    def test_levels(self):
+        assert compileSort(None) == ((None, False), {})
+        _, levels = compileSort(([], {"2": [(0, True)], 3: []}))
+        assert list(levels.keys()) == [2]
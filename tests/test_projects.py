@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# This is a part of td @ http://github.com/KenjiTakahashi/td
+# Karol "Kenji Takahashi" Woźniak © 2012 - 2013
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import marshal
+import shutil
+import tempfile
+from td.model import Model
+from td.projects import find, collect, summarize
+
+
+class ProjectsTest(object):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='td-projects.')
+        self.gpath = os.path.join(self.root, '.tdrc')
+        self.cache = os.path.join(self.root, '.tdprojects')
+        self.addList('a', [("a1", 3, False), ("a2", 5, True)])
+        self.addList('a/b', [("b1", 1, False)])
+        self.addList('.hidden', [("h1", 3, False)])
+        os.makedirs(os.path.join(self.root, 'dev'))
+        with open(os.path.join(self.root, 'dev', '.todo'), 'w') as f:
+            f.write(
+                '<todo version="0.1.20">'
+                '<note priority="high" done="1">dev1'
+                '<note priority="low">dev2</note>'
+                '</note>'
+                '</todo>'
+            )
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def path(self, directory):
+        return os.path.join(self.root, directory)
+
+    def addList(self, directory, items):
+        os.makedirs(self.path(directory), exist_ok=True)
+        model = Model()
+        model.setPath(os.path.join(self.path(directory), '.td'))
+        model.gpath = self.gpath
+        with model.session():
+            for name, priority, done in items:
+                model.add(name, priority=priority)
+                if done:
+                    model.edit(str(len(model)), done=True)
+
+
+class TestFind(ProjectsTest):
+    def test_find(self):
+        assert find(self.root) == [
+            self.path('a'), self.path('a/b'), self.path('dev')
+        ]
+
+    def test_root(self):
+        self.addList('', [("r1", 3, False)])
+        assert find(self.root)[0] == self.root
+
+
+class TestCollect(ProjectsTest):
+    def test_collect(self):
+        results = collect(self.root, self.gpath, jobs=1)
+        assert [(d, items, e) for d, items, e in results] == [
+            (self.path('a'), [
+                ["a1", 3, "", False, []], ["a2", 5, "", True, []]
+            ], None),
+            (self.path('a/b'), [["b1", 1, "", False, []]], None),
+            (self.path('dev'), [
+                ["dev1", 4, "", True, [["dev2", 2, "", False, []]]]
+            ], None)
+        ]
+
+    def test_does_not_convert_devtodo(self):
+        collect(self.root, self.gpath)
+        assert not os.path.exists(os.path.join(self.path('dev'), '.td'))
+
+    def test_parallel(self):
+        assert collect(self.root, self.gpath, jobs=2) == \
+            collect(self.root, self.gpath, jobs=1)
+
+
+class TestSummarize(ProjectsTest):
+    def summarize(self, **kwargs):
+        return summarize(self.root, self.gpath, cache=self.cache, **kwargs)
+
+    def test_counts(self):
+        assert self.summarize() == [
+            (self.path('a'), {3: [1, 0], 5: [0, 1]}, None),
+            (self.path('a/b'), {1: [1, 0]}, None),
+            (self.path('dev'), {4: [0, 1], 2: [1, 0]}, None)
+        ]
+
+    def test_parallel(self):
+        assert self.summarize(jobs=2) == self.summarize(jobs=1)
+
+    def test_uses_cache(self):
+        self.summarize()
+        with open(self.cache, 'rb') as f:
+            cached = marshal.load(f)
+        cached[self.path('a')][1] = {3: [7, 7]}
+        cached[self.path('a/b')][1] = {3: [7, 7]}
+        with open(self.cache, 'wb') as f:
+            marshal.dump(cached, f)
+        self.addList('a/b', [("b2", 1, True)])
+        assert [counts for _, counts, _ in self.summarize()] == [
+            {3: [7, 7]}, {1: [1, 1]}, {4: [0, 1], 2: [1, 0]}
+        ]
+
+    def test_drops_lists_gone(self):
+        self.summarize()
+        os.remove(os.path.join(self.path('a/b'), '.td'))
+        self.summarize()
+        with open(self.cache, 'rb') as f:
+            assert sorted(marshal.load(f)) == [
+                self.path('a'), self.path('dev')
+            ]
+
+    def test_unreadable_list(self):
+        os.makedirs(self.path('bad'))
+        with open(os.path.join(self.path('bad'), '.td'), 'w') as f:
+            f.write('{broken')
+        result = self.summarize()[2]
+        assert result[:2] == (self.path('bad'), None)
+        assert result[2]
+        with open(self.cache, 'rb') as f:
+            assert self.path('bad') not in marshal.load(f)
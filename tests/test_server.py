@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# This is a part of td @ http://github.com/KenjiTakahashi/td
+# Karol "Kenji Takahashi" Woźniak © 2012 - 2013
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
+import threading
+from tests.mocks import StdoutMock
+from td.client import forward
+from td.main import Get
+from td.model import Model
+from td.server import Server
+
+
+class ServerTest(object):
+    def setUp(self):
+        self.path = os.path.join(os.getcwd(), 'tests')
+        self.tdpath = os.path.join(self.path, '.td')
+        self.sockpath = os.path.join(self.path, '.td.sock')
+        self.server = Server(self.sockpath)
+        Get.interactive = False
+        model = Model()
+        model.setPath(self.tdpath)
+        model.gpath = os.path.join(self.path, '.tdrc')
+        model.add("testname1")
+        model.add("testname0")
+
+    def tearDown(self):
+        Get.interactive = True
+        self.server.server_close()
+        for path in [
+            self.sockpath, self.tdpath, self.tdpath + '~',
+            self.tdpath + '.cache', self.tdpath + '.lock'
+        ]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def execute(self, *args):
+        return self.server.execute(["td"] + list(args), self.path, self.path)
+
+
+class TestServer(ServerTest):
+    def test_runs_command(self):
+        result = self.execute("v", "--no-color")
+        assert result == {
+            'status': 'ok',
+            'stdout': "1.testname1\n2.testname0\n",
+            'stderr': ""
+        }
+
+    def test_keeps_model_loaded(self):
+        self.execute("v")
+        model = self.server.models[self.tdpath]
+        assert model._loaded is True
+        self.execute("a", "1", "-n", "testname2", "-p", "3", "-c", "c")
+        assert model._loaded is True
+        assert model.get("1.1")[1] == "testname2"
+
+    def test_reads_changed_file(self):
+        self.execute("v")
+        with open(self.tdpath, 'w') as f:
+            f.write(json.dumps({
+                'items': [["testname2", 3, "", False, []]],
+                'refs': {}, 'options': {}
+            }))
+        result = self.execute("v", "--no-color")
+        assert result['stdout'] == "1.testname2\n"
+
+    def test_changed_options_are_applied(self):
+        self.execute("v")
+        self.execute("o", "-s", "name+")
+        result = self.execute("v", "--no-color")
+        assert result['stdout'] == "1.testname0\n2.testname1\n"
+
+    def test_asks_client_to_run_interactive_commands(self):
+        result = self.execute("a")
+        assert result == {'status': 'local'}
+        assert self.server.models[self.tdpath]._loaded is False
+
+
+class TestClient(ServerTest):
+    def setUp(self):
+        super().setUp()
+        self.mock = StdoutMock()
+        self.environ = os.environ.get('TD_SOCKET')
+        os.environ['TD_SOCKET'] = self.sockpath
+        self.cwd = os.getcwd()
+        os.chdir(self.path)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        if self.environ is None:
+            del os.environ['TD_SOCKET']
+        else:
+            os.environ['TD_SOCKET'] = self.environ
+        self.mock.undo()
+        super().tearDown()
+
+    def test_forwards_command(self):
+        thread = threading.Thread(target=self.server.handle_request)
+        thread.start()
+        assert forward(["td", "v", "--no-color"]) is True
+        thread.join()
+        self.mock.assertEqual("1.testname1\n2.testname0\n")
+
+    def test_runs_locally_without_server(self):
+        self.server.server_close()
+        os.remove(self.sockpath)
+        assert forward(["td", "v"]) is False
+
+    def test_does_not_forward_server(self):
+        assert forward(["td", "--server"]) is False